@@ -0,0 +1,25 @@
+"""
+指标内核 AOT 编译脚本（需要安装 numba）
+
+用法:
+    python build_indicators.py
+
+在当前目录生成 indicators_aot.*.so（Windows 为 .pyd），
+indicators.py 导入时优先加载该模块，跳过每次启动的 JIT 编译。
+更换 Python/NumPy 版本或平台后需重新编译。
+"""
+
+from pathlib import Path
+
+from numba.pycc import CC
+
+from indicators import _compute_indicators_jit
+
+cc = CC('indicators_aot')
+cc.output_dir = str(Path(__file__).resolve().parent)
+cc.export('_compute_indicators_nb', 'f8[:,:](f8[:], f8[:], f8[:])')(_compute_indicators_jit.py_func)
+
+
+if __name__ == '__main__':
+    cc.compile()
+    print(f"✅ 已生成 {cc.output_file}")
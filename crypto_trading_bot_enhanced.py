@@ -5,17 +5,162 @@
 """
 
 import os
-from openai import OpenAI
-import ccxt
+import math
+import atexit
+import asyncio
+import ssl
+import aiohttp
+import certifi
+from openai import AsyncOpenAI
+import ccxt.async_support as ccxt
+import ccxt.pro as ccxtpro
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
-import json
+from datetime import datetime
+import codecs
+import csv
 import time
-from typing import Dict, List, Optional
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 import logging
+import logging.handlers
+from queue import SimpleQueue
 from pathlib import Path
-from risk_manager import MonthlyRiskManager
+from risk_manager import MonthlyRiskManager, _json_dumps, _json_loads
+from indicators import INDICATOR_COLUMNS, IndicatorState, _compute_indicators_nb, njit
+
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pacsv
+except ImportError:  # pyarrow 为可选依赖，缺失时报告由标准库 csv 生成
+    pa = None
+
+
+# 价格格式按数量级 floor(log10(p)) 查表：<1 保留4位，<100 保留2位，其余1位
+_MIN_DECADE, _MAX_DECADE = -1, 2
+_FMT_BY_DECADE = {-1: '%.4f', 0: '%.2f', 1: '%.2f', 2: '%.1f'}
+_FMT_TABLE = np.array([_FMT_BY_DECADE[d] for d in range(_MIN_DECADE, _MAX_DECADE + 1)])
+
+# WebSocket 推送的 ticker 在此时长内视为新鲜，可替代 REST 批量行情
+_STREAM_TICKER_MAX_AGE_MS = 60_000
+# 5m K线周期（毫秒）
+_BAR_5M_MS = 5 * 60 * 1000
+
+# OKX 批量下单接口每次最多 20 笔
+_ORDER_BATCH_SIZE = 20
+# 平仓失败后 tick 触发重试的退避（秒）：5, 10, 20 ... 上限 300
+_CLOSE_RETRY_BASE_SECONDS = 5
+_CLOSE_RETRY_MAX_SECONDS = 300
+# 单次 AI 请求最多包含的币种数，超出时拆分为子批次并发请求
+_AI_BATCH_SIZE = 8
+
+# 持仓 SoA 布局：side_sign 多头为 1，空头为 -1
+_POSITION_DTYPE = np.dtype([
+    ('entry_price', np.float64),
+    ('quantity', np.float64),
+    ('leverage', np.float64),
+    ('side_sign', np.float64),
+    # 止损/止盈价，未设置为 NaN；最新标记价（行情推送/决策周期写入），未知为 NaN
+    ('stop_loss', np.float64),
+    ('profit_target', np.float64),
+    ('mark_price', np.float64),
+])
+
+
+@njit(cache=True)
+def _stop_triggers_nb(price, stop_loss, profit_target):
+    """
+    全部持仓一次性判断止损/止盈
+
+    Returns:
+        int8 数组：1=止损, 2=止盈（同时满足时止损优先）, 0=未触发；NaN 参与比较恒为假，不会触发
+    """
+    return np.where(price <= stop_loss, 1, np.where(price >= profit_target, 2, 0)).astype(np.int8)
+
+
+def _fmt_ts(ns: int) -> str:
+    """纳秒时间戳格式化为本地时间（仅用于日志/报告展示）"""
+    return datetime.fromtimestamp(ns / 1e9).isoformat(sep=' ', timespec='seconds')
+
+
+def _exit_level(value) -> float:
+    """止损/止盈价转为 float：未设置（None/0）或无法解析时为 NaN"""
+    try:
+        return float(value) if value else math.nan
+    except (TypeError, ValueError):
+        return math.nan
+
+
+@dataclass
+class MarketSnapshot:
+    """单个币种一轮的行情快照（K线为连续 float64 数组，下游可直接做向量运算）"""
+
+    coin: str
+    source_symbol: str
+    # 5m K线 (n, 6)：timestamp, open, high, low, close, volume
+    ohlcv: np.ndarray = field(repr=False)
+    current_price: float
+    current_ema_20: float
+    current_macd: float
+    current_rsi_7: float
+    open_interest: Dict[str, float]
+    funding_rate: float
+    minute_series: Dict[str, List[float]]
+    trend_context: Dict[str, object]
+    change_24h_percent: float
+    high_24h: float
+    low_24h: float
+    volume_24h: float
+    data_note: str = ''
+
+    @property
+    def last_bar_ts(self) -> int:
+        """最新 5m K线的开盘时间（毫秒）"""
+        return int(self.ohlcv[-1, 0])
+
+
+@dataclass(slots=True)
+class ExitPlan:
+    """持仓的止盈/止损计划（由 AI 决策给出）"""
+
+    profit_target: Optional[float] = None
+    stop_loss: Optional[float] = None
+    invalidation_condition: Optional[str] = None
+
+
+@dataclass(slots=True)
+class Position:
+    """当前持仓"""
+
+    coin: str
+    side: str
+    quantity: float
+    entry_price: float
+    leverage: int
+    risk_usd: float
+    confidence: float
+    exit_plan: ExitPlan
+    entry_time_ns: int
+    entry_order_id: str
+
+
+@dataclass(slots=True)
+class TradeRecord:
+    """已平仓交易（字段顺序即报告 CSV 的列顺序）"""
+
+    coin: str
+    side: str
+    quantity: float
+    entry_price: float
+    exit_price: float
+    pnl: float
+    pnl_pct: float
+    hold_hours: float
+    reason: str
+    timestamp: int  # 纳秒时间戳
+
 
 class CryptoAITrader:
     """
@@ -30,7 +175,7 @@ class CryptoAITrader:
         self.config = self._load_config()
         
         # 初始化 DeepSeek-V3 客户端 (通过火山引擎 ARK)
-        self.ai_client = OpenAI(
+        self.ai_client = AsyncOpenAI(
             base_url="https://ark.cn-beijing.volces.com/api/v3",
             api_key=self.config['ARK_API_KEY']
         )
@@ -45,14 +190,39 @@ class CryptoAITrader:
         self.risk_manager = MonthlyRiskManager('trading_memory.json')
 
         # 交易状态
-        self.positions = {}  # 当前持仓
-        self.trade_history = []  # 交易历史
+        self.positions: Dict[str, Position] = {}  # 当前持仓（仅在事件循环线程中修改，无需加锁）
+        self._closing = set()  # 正在平仓的合约，防止 tick 触发与 AI 决策重复平仓
+        # 平仓失败的合约：(连续失败次数, 允许再次触发的单调时钟时刻)
+        self._close_failures: Dict[str, Tuple[int, float]] = {}
+        # 持仓的 SoA 镜像（向量化盯市与止损/止盈检查），行顺序同 self.positions
+        self._position_symbols: List[str] = []
+        self._position_index: Dict[str, int] = {}
+        self._position_book = np.empty(0, dtype=_POSITION_DTYPE)
+        self.trade_history: List[TradeRecord] = []  # 交易历史
+        # 平仓收益率的运行统计量（夏普比率）
+        self._pnl_n = 0
+        self._pnl_mean = 0.0
+        self._pnl_m2 = 0.0
         self.initial_balance = None
         self.month_initialized = False  # 月度初始化标记
         
         # 监控的币种（市值前10）
         self.coin_list = ['BTC', 'ETH', 'XRP', 'BNB', 'SOL', 'DOGE', 'ADA', 'TRX', 'AVAX', 'LINK']
-        self.symbols = [self._convert_symbol(f"{coin}/USDT") for coin in self.coin_list]
+        # 币种 <-> 合约符号映射预先计算，热路径直接查表
+        self._symbol_by_coin: Dict[str, str] = {coin: self._convert_symbol(f"{coin}/USDT") for coin in self.coin_list}
+        self._coin_by_symbol: Dict[str, str] = {symbol: coin for coin, symbol in self._symbol_by_coin.items()}
+        self.symbols = list(self._symbol_by_coin.values())
+
+        # 增量行情缓存：每个合约的 5m K线窗口与 5m/20m 指标状态
+        self._ohlcv_cache: Dict[str, List] = {}
+        # WebSocket 推送的最新 ticker（按合约）
+        self._latest_tickers: Dict[str, Dict] = {}
+        self._indicator_states: Dict[str, Tuple[IndicatorState, IndicatorState]] = {}
+
+        # 提示词静态骨架（框架/约束部分不随行情变化，只构建一次）
+        self._prompt_static_header, self._prompt_static_footer = self._build_prompt_templates()
+        # 各币种市场分析段落的 LRU 缓存（最多256条）
+        self._coin_section_cache: OrderedDict = OrderedDict()
         
         # 设置日志
         self._setup_logging()
@@ -76,14 +246,18 @@ class CryptoAITrader:
             'OKX_SECRET_KEY': os.getenv('OKX_SECRET_KEY', ''),
             'OKX_PASSPHRASE': os.getenv('OKX_PASSPHRASE', ''),
             'OKX_DEMO': False,
+
+            # 事件循环绑定的 CPU 核（配合内核启动参数 isolcpus 独占），null 表示不绑定
+            'CPU_CORE': None,
+            # 提高进程优先级并启用 SCHED_FIFO 实时调度（需 CAP_SYS_NICE），默认关闭
+            'REALTIME_SCHED': False,
         }
 
         # 尝试从 config.json 读取
         config_file = Path('config.json')
         if config_file.exists():
-            with open(config_file, 'r', encoding='utf-8') as f:
-                file_config = json.load(f)
-                config.update(file_config)
+            file_config = _json_loads(config_file.read_bytes())
+            config.update(file_config)
 
         # 验证必需配置
         if not config['ARK_API_KEY']:
@@ -105,11 +279,13 @@ class CryptoAITrader:
 
     def _init_okx_testnet(self):
         """初始化 OKX 交易环境 (USDT 本位永续)"""
-        exchange = ccxt.okx({
+        # ccxt.pro 客户端同时支持 REST 与 WebSocket 订阅
+        exchange = ccxtpro.okx({
             'apiKey': self.config['OKX_API_KEY'],
             'secret': self.config['OKX_SECRET_KEY'],
             'password': self.config['OKX_PASSPHRASE'],
             'enableRateLimit': True,
+            'aiohttp_trust_env': True,
             'options': {
                 'defaultType': 'swap',  # USDT 本位永续
                 'recvWindow': 50000,
@@ -132,267 +308,382 @@ class CryptoAITrader:
             # 实盘模式
             print("✅ 已连接到 OKX 实盘")
 
-        # 测试连接
+        return exchange
+
+    def _open_http_session(self):
+        """创建复用 TCP/TLS 连接的 aiohttp 会话（供 ccxt 所有 REST 请求共享，需在事件循环内调用）"""
+        connector = aiohttp.TCPConnector(
+            ssl=ssl.create_default_context(cafile=certifi.where()),
+            limit=100,
+            ttl_dns_cache=300,
+            keepalive_timeout=75,
+            enable_cleanup_closed=True,
+        )
+        # 会话与连接器由 ccxt 持有，exchange.close() 时一并关闭
+        self.exchange.tcp_connector = connector
+        self.exchange.session = aiohttp.ClientSession(connector=connector, trust_env=self.exchange.aiohttp_trust_env)
+
+    async def _check_connection(self):
+        """建立连接池、预加载市场信息并测试交易所连接（异步客户端需在事件循环内调用）"""
+        env_name = "模拟盘" if self.config.get('OKX_DEMO', False) else "实盘"
+        self._open_http_session()
         try:
-            balance = exchange.fetch_balance()
+            _, balance = await asyncio.gather(self.exchange.load_markets(), self.exchange.fetch_balance())
             usdt_balance = balance.get('USDT', {}).get('free', 0)
-            env_name = "模拟盘" if is_demo else "实盘"
             print(f"✅ OKX {env_name}连接成功")
             print(f"USDT 余额: {usdt_balance:.2f}")
         except Exception as e:
-            env_name = "模拟盘" if is_demo else "实盘"
             raise ConnectionError(f"OKX {env_name}连接失败: {e}")
 
-        return exchange
-
-    def _convert_symbol(self, symbol: str) -> str:
-        """OKX 永续合约格式: 'BTC/USDT:USDT'"""
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _convert_symbol(symbol: str) -> str:
+        """OKX 永续合约格式: 'BTC/USDT:USDT'（热路径请直接查 _symbol_by_coin）"""
         coin = symbol.split('/')[0] if '/' in symbol else symbol.replace('USDT', '').strip()
         return f"{coin}/USDT:USDT"
 
     def _setup_logging(self):
-        """设置日志"""
+        """设置日志：记录在调用线程完成 %-参数插值后入队，格式化与文件/控制台写入在后台监听线程完成，不阻塞事件循环"""
         log_format = '%(asctime)s - %(levelname)s - %(message)s'
+        date_format = '%Y-%m-%d %H:%M:%S'
         
         file_handler = logging.FileHandler(
             f'outputs/trading_{datetime.now().strftime("%Y%m%d_%H%M%S")}.log',
             encoding='utf-8'
         )
-        file_handler.setFormatter(logging.Formatter(log_format))
+        file_handler.setFormatter(logging.Formatter(log_format, datefmt=date_format))
         
         console_handler = logging.StreamHandler()
-        console_handler.setFormatter(logging.Formatter(log_format))
+        console_handler.setFormatter(logging.Formatter(log_format, datefmt=date_format))
         
+        log_queue: SimpleQueue = SimpleQueue()
+        self._log_listener = logging.handlers.QueueListener(
+            log_queue, file_handler, console_handler, respect_handler_level=True
+        )
+        self._log_listener.start()
+        # 退出时排空队列，保证最后的报告写入日志文件
+        atexit.register(self._log_listener.stop)
+
         self.logger = logging.getLogger('CryptoAITrader')
         self.logger.setLevel(logging.INFO)
-        self.logger.addHandler(file_handler)
-        self.logger.addHandler(console_handler)
+        self.logger.addHandler(logging.handlers.QueueHandler(log_queue))
     
     # ========== 数据获取 ==========
     
-    def fetch_market_data(self) -> Dict:
-        """获取所有币种的市场数据（带健壮回退）"""
-        market_data = {}
-
-        def is_series_invalid(closes: List[float]) -> bool:
-            if not closes or len(closes) < 10:
-                return True
-            arr = np.array(closes, dtype=float)
-            # 全为0或几乎恒定
-            if np.allclose(arr, 0):
-                return True
-            unique = np.unique(np.round(arr, 4))
-            if unique.size <= 2:
-                return True
-            # 低波动（过去100根标准差过低）
-            if np.std(arr) < 1e-8:
-                return True
-            return False
+    async def fetch_market_data(self) -> Dict[str, MarketSnapshot]:
+        """获取所有币种的市场数据（协程并发，带健壮回退）"""
+        tickers = self._fresh_stream_tickers() or await self._fetch_tickers()
+
+        # 纯网络 I/O：各币种请求同时发出，限流交由 ccxt 的 enableRateLimit 处理
+        fetched = await asyncio.gather(
+            *(self._fetch_one(symbol, tickers) for symbol in self.symbols),
+            return_exceptions=True,
+        )
 
+        # gather 按提交顺序返回，提示词中币种顺序与监控列表一致
+        results = {}
+        for symbol, item in zip(self.symbols, fetched):
+            if isinstance(item, Exception):
+                self.logger.error(f"获取 {symbol} 数据失败: {item}")
+                continue
+            coin, data = item
+            if data is not None:
+                results[coin] = data
+        return results
+
+    def _fresh_stream_tickers(self) -> Dict:
+        """所有监控合约都有新鲜的推送 ticker 时直接使用，省去一次 REST 请求"""
+        now_ms = time.time() * 1000
+        tickers = {}
         for symbol in self.symbols:
-            # 从符号提取币种名称（OKX 格式）
-            coin = symbol.split('/')[0] if '/' in symbol else symbol.replace('USDT', '').strip()
-            self.logger.info(f"获取 {coin} 数据...")
+            ticker = self._fresh_ticker(symbol, now_ms)
+            if ticker is None:
+                return {}
+            tickers[symbol] = ticker
+        return tickers
+
+    def _fresh_ticker(self, symbol: str, now_ms: float) -> Optional[Dict]:
+        """返回合约在 _STREAM_TICKER_MAX_AGE_MS 内收到的推送 ticker，没有则返回 None"""
+        ticker = self._latest_tickers.get(symbol)
+        if not ticker or now_ms - (ticker.get('timestamp') or 0) > _STREAM_TICKER_MAX_AGE_MS:
+            return None
+        return ticker
+
+    async def _fetch_tickers(self) -> Dict:
+        """一次请求批量获取所有监控合约的行情；不支持或失败时返回空，由各币种单独获取"""
+        try:
+            return await self.exchange.fetch_tickers(self.symbols)
+        except ccxt.NotSupported:
+            return {}
+        except Exception as e:
+            self.logger.warning(f"批量获取行情失败，改为逐个获取: {e}")
+            return {}
 
-            used_symbol = symbol
-            data_note = ''
-            funding_rate = 0.0001
-            open_interest = 0.0
+    @staticmethod
+    def _is_series_invalid(closes: np.ndarray) -> bool:
+        """判断K线收盘价序列是否异常（过短、全0、几乎恒定）"""
+        if closes.size < 10:
+            return True
+        # 全为0
+        if np.allclose(closes, 0):
+            return True
+        # 几乎恒定：极差相对最新价过小（或绝对值过小）
+        if np.ptp(closes) < max(1e-4 * abs(closes[-1]), 1e-8):
+            return True
+        return False
+
+    async def _fetch_one(self, symbol: str, tickers: Optional[Dict] = None) -> Tuple[str, Optional[MarketSnapshot]]:
+        """获取单个币种的市场数据，失败或数据异常时返回 (coin, None)"""
+        coin = self._coin_by_symbol[symbol]
+        self.logger.info("获取 %s 数据...", coin)
+
+        used_symbol = symbol
+        data_note = ''
+        funding_rate = 0.0001
+        open_interest = 0.0
 
+        try:
+            # 交易周期：5m；趋势周期：20m（由5m聚合）
+            # K线/资金费率/未平仓量互不依赖，同时请求
+            ohlcv_result, funding, oi = await asyncio.gather(
+                self._fetch_ohlcv_5m(symbol),
+                self.exchange.fetch_funding_rate(symbol),
+                self.exchange.fetch_open_interest(symbol),
+                return_exceptions=True,
+            )
+            if isinstance(ohlcv_result, Exception):
+                raise ohlcv_result
+            ohlcv_5m, cold_start = ohlcv_result
+            ticker = (tickers or {}).get(symbol) or await self.exchange.fetch_ticker(symbol)
+
+            # 仅合约有资金费率/未平仓量
+            try:
+                funding_rate = float(funding.get('fundingRate', 0.0001) or 0.0001)
+            except Exception:
+                funding_rate = 0.0001
             try:
-                # 交易周期：5m；趋势周期：20m（由5m聚合）
-                ohlcv_5m = self.exchange.fetch_ohlcv(symbol, '5m', limit=200)
-                ticker = self.exchange.fetch_ticker(symbol)
+                open_interest = float(oi.get('openInterestAmount') or 0)
+            except Exception:
+                open_interest = 0.0
+
+            # 5m 数据 + 20m 聚合
+            df_5m = self._klines_to_df(ohlcv_5m[-120:])
+            ohlcv_20m = self._aggregate_ohlcv_by_ms(ohlcv_5m, 20 * 60 * 1000)
+            df_20m = self._klines_to_df(ohlcv_20m[-60:])
+            close_5m = df_5m['close'].to_numpy()
+            close_20m = df_20m['close'].to_numpy()
+            series_invalid = self._is_series_invalid(close_5m) or self._is_series_invalid(close_20m)
+
+            # 如果数据明显异常，回退到现货对
+            if series_invalid:
+                # 缓存与增量状态已不可信，下一轮冷启动
+                self._ohlcv_cache.pop(symbol, None)
+                self._indicator_states.pop(symbol, None)
+                spot_symbol = f"{coin}/USDT"
 
-                # 仅合约有资金费率/未平仓量
-                try:
-                    funding = self.exchange.fetch_funding_rate(symbol)
-                    funding_rate = float(funding.get('fundingRate', 0.0001) or 0.0001)
-                except Exception:
-                    funding_rate = 0.0001
                 try:
-                    oi = self.exchange.fetch_open_interest(symbol)
-                    open_interest = float(oi.get('openInterestAmount') or 0)
-                except Exception:
-                    open_interest = 0.0
-
-                # 5m 数据 + 20m 聚合
-                df_5m = self._klines_to_df(ohlcv_5m[-120:])
-                ohlcv_20m = self._aggregate_ohlcv_by_ms(ohlcv_5m, 20 * 60 * 1000)
-                df_20m = self._klines_to_df(ohlcv_20m[-60:])
-
-                # 如果数据明显异常，回退到现货对
-                if is_series_invalid(df_5m['close'].tolist()) or is_series_invalid(df_20m['close'].tolist()):
-                    spot_symbol = f"{coin}/USDT"
-
-                    try:
-                        spot_5m = self.exchange.fetch_ohlcv(spot_symbol, '5m', limit=200)
-                        spot_ticker = self.exchange.fetch_ticker(spot_symbol)
-                        df_5m = self._klines_to_df(spot_5m[-120:])
-                        ohlcv_20m = self._aggregate_ohlcv_by_ms(spot_5m, 20 * 60 * 1000)
-                        df_20m = self._klines_to_df(ohlcv_20m[-60:])
-                        ticker = spot_ticker
-                        used_symbol = spot_symbol
-                        data_note = 'spot_fallback'
-                    except Exception as _:
-                        data_note = 'invalid_series'
-
-                indicators_5m = self._calculate_indicators(df_5m)
-                indicators_20m = self._calculate_indicators(df_20m)
+                    spot_5m, spot_ticker = await asyncio.gather(
+                        self.exchange.fetch_ohlcv(spot_symbol, '5m', limit=200),
+                        self.exchange.fetch_ticker(spot_symbol),
+                    )
+                    df_5m = self._klines_to_df(spot_5m[-120:])
+                    ohlcv_20m = self._aggregate_ohlcv_by_ms(spot_5m, 20 * 60 * 1000)
+                    df_20m = self._klines_to_df(ohlcv_20m[-60:])
+                    close_5m = df_5m['close'].to_numpy()
+                    close_20m = df_20m['close'].to_numpy()
+                    series_invalid = self._is_series_invalid(close_5m) or self._is_series_invalid(close_20m)
+                    ticker = spot_ticker
+                    used_symbol = spot_symbol
+                    data_note = 'spot_fallback'
+                except Exception as _:
+                    data_note = 'invalid_series'
 
                 # 如果仍异常，跳过该币种
-                if is_series_invalid(df_5m['close'].tolist()) or is_series_invalid(df_20m['close'].tolist()):
+                if series_invalid:
                     self.logger.warning(f"{coin} K线数据异常，已跳过 (source={used_symbol}, note={data_note})")
-                    time.sleep(0.05)
-                    continue
+                    return coin, None
 
-                market_data[coin] = {
-                    'source_symbol': used_symbol,
-                    'current_price': float(ticker['last']),
-                    'current_ema_20': float(indicators_5m['ema_20'].iloc[-1]),
-                    'current_macd': float(indicators_5m['macd_histogram'].iloc[-1]),
-                    'current_rsi_7': float(indicators_5m['rsi_7'].iloc[-1]),
-                    'open_interest': {
-                        'latest': open_interest,
-                        'average': open_interest
-                    },
-                    'funding_rate': funding_rate if used_symbol == symbol else 0.0,
-                    'minute_series': {
-                        'mid_price': [float(x) for x in df_5m['close'].tail(10).tolist()],
-                        'ema_20': [float(x) for x in indicators_5m['ema_20'].tail(10).tolist()],
-                        'macd': [float(x) for x in indicators_5m['macd_histogram'].tail(10).tolist()],
-                        'rsi_7': [float(x) for x in indicators_5m['rsi_7'].tail(10).tolist()],
-                        'rsi_14': [float(x) for x in indicators_5m['rsi_14'].tail(10).tolist()],
-                    },
-                    'trend_context': {
-                        'ema_20': float(indicators_20m['ema_20'].iloc[-1]),
-                        'ema_50': float(indicators_20m['ema_50'].iloc[-1]),
-                        'atr_3': float(indicators_20m['atr_3'].iloc[-1]),
-                        'atr_14': float(indicators_20m['atr_14'].iloc[-1]),
-                        'current_volume': float(df_20m['volume'].iloc[-1]),
-                        'average_volume': float(df_20m['volume'].mean()),
-                        'macd_series': [float(x) for x in indicators_20m['macd_histogram'].tail(10).tolist()],
-                        'rsi_14_series': [float(x) for x in indicators_20m['rsi_14'].tail(10).tolist()],
-                    },
-                    '24h_change_percent': float(ticker.get('percentage') or 0),
-                    '24h_high': float(ticker.get('high') or 0),
-                    '24h_low': float(ticker.get('low') or 0),
-                    '24h_volume': float(ticker.get('quoteVolume') or ticker.get('baseVolume') or 0),
-                    'data_note': data_note,
-                }
-
-                time.sleep(0.1)  # 避免限流
+                indicators_5m = self._calculate_indicators(df_5m)
+                indicators_20m = self._calculate_indicators(df_20m)
+            else:
+                indicators_5m, indicators_20m = self._advance_indicators(
+                    symbol, ohlcv_5m[-120:], ohlcv_20m[-60:], cold_start
+                )
 
-            except Exception as e:
-                self.logger.error(f"获取 {symbol} 数据失败: {e}")
-                continue
+            return coin, MarketSnapshot(
+                coin=coin,
+                source_symbol=used_symbol,
+                ohlcv=df_5m.to_numpy(dtype=np.float64),
+                current_price=float(ticker['last']),
+                current_ema_20=float(indicators_5m['ema_20'][-1]),
+                current_macd=float(indicators_5m['macd_histogram'][-1]),
+                current_rsi_7=float(indicators_5m['rsi_7'][-1]),
+                open_interest={
+                    'latest': open_interest,
+                    'average': open_interest
+                },
+                funding_rate=funding_rate if used_symbol == symbol else 0.0,
+                minute_series={
+                    'mid_price': close_5m[-10:].tolist(),
+                    'ema_20': [float(x) for x in indicators_5m['ema_20'][-10:].tolist()],
+                    'macd': [float(x) for x in indicators_5m['macd_histogram'][-10:].tolist()],
+                    'rsi_7': [float(x) for x in indicators_5m['rsi_7'][-10:].tolist()],
+                    'rsi_14': [float(x) for x in indicators_5m['rsi_14'][-10:].tolist()],
+                },
+                trend_context={
+                    'ema_20': float(indicators_20m['ema_20'][-1]),
+                    'ema_50': float(indicators_20m['ema_50'][-1]),
+                    'atr_3': float(indicators_20m['atr_3'][-1]),
+                    'atr_14': float(indicators_20m['atr_14'][-1]),
+                    'current_volume': float(df_20m['volume'].iloc[-1]),
+                    'average_volume': float(df_20m['volume'].mean()),
+                    'macd_series': [float(x) for x in indicators_20m['macd_histogram'][-10:].tolist()],
+                    'rsi_14_series': [float(x) for x in indicators_20m['rsi_14'][-10:].tolist()],
+                },
+                change_24h_percent=float(ticker.get('percentage') or 0),
+                high_24h=float(ticker.get('high') or 0),
+                low_24h=float(ticker.get('low') or 0),
+                volume_24h=float(ticker.get('quoteVolume') or ticker.get('baseVolume') or 0),
+                data_note=data_note,
+            )
 
-        return market_data
+        except Exception as e:
+            self.logger.error(f"获取 {symbol} 数据失败: {e}")
+            return coin, None
     
+    async def _fetch_ohlcv_5m(self, symbol: str) -> Tuple[List, bool]:
+        """
+        获取 5m K线窗口（最近200根）
+
+        已有缓存时从缓存中最后一根已收盘K线起增量拉取（since），只解析新增部分；
+        该K线作为校验锚点，交易所返回值与缓存不一致说明历史被修订，
+        与无法衔接（冷启动/断档）一样全量拉取并重建指标。
+        增量结果被 limit 截断或未到达当前K线（长时间暂停后）时同样全量拉取。
+
+        Returns:
+            (K线窗口, 是否冷启动)
+        """
+        cached = self._ohlcv_cache.get(symbol)
+        if cached and len(cached) >= 2:
+            anchor = cached[-2]
+            limit = 100
+            recent = await self.exchange.fetch_ohlcv(symbol, '5m', since=int(anchor[0]), limit=limit)
+            # 当前K线的开盘时间；允许落后一根（交易所在整点边界生成新K线略有延迟）
+            current_bar = int(time.time() * 1000) // _BAR_5M_MS * _BAR_5M_MS
+            caught_up = bool(recent) and len(recent) < limit and recent[-1][0] >= current_bar - _BAR_5M_MS
+            if caught_up and recent[0][0] == anchor[0]:
+                if list(recent[0][:6]) == list(anchor[:6]):
+                    window = (cached[:-2] + recent)[-200:]
+                    self._ohlcv_cache[symbol] = window
+                    return window, False
+                self.logger.debug("%s 已收盘K线被修订，全量重建", symbol)
+
+        window = await self.exchange.fetch_ohlcv(symbol, '5m', limit=200)
+        self._ohlcv_cache[symbol] = window
+        return window, True
+
+    def _advance_indicators(self, symbol: str, klines_5m: List, klines_20m: List,
+                            cold_start: bool) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+        """增量推进 5m/20m 指标状态；冷启动时用整段窗口重建"""
+        states = self._indicator_states.get(symbol)
+        if states is None or cold_start:
+            states = (IndicatorState(), IndicatorState())
+            self._indicator_states[symbol] = states
+
+        state_5m, state_20m = states
+        return state_5m.advance(klines_5m), state_20m.advance(klines_20m)
+
     def _klines_to_df(self, klines: List) -> pd.DataFrame:
-        """K线转DataFrame"""
-        df = pd.DataFrame(klines, columns=[
-            'timestamp', 'open', 'high', 'low', 'close', 'volume'
-        ])
-        for col in ['open', 'high', 'low', 'close', 'volume']:
-            df[col] = df[col].astype(float)
-        return df
+        """K线转DataFrame（一次转换为连续 float64 块，不逐列 astype）"""
+        try:
+            arr = np.asarray(klines, dtype=np.float64)
+        except TypeError:
+            # 个别字段为 None（如成交量缺失）时按 NaN 处理
+            arr = np.array([[np.nan if x is None else x for x in row] for row in klines], dtype=np.float64)
+        return pd.DataFrame(
+            arr.reshape(-1, 6),
+            columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'],
+            copy=False,
+        )
 
     def _aggregate_ohlcv_by_ms(self, klines: List[List[float]], bucket_ms: int) -> List[List[float]]:
         """按时间桶聚合 OHLCV，open=首根open, high=max, low=min, close=末根close, volume=sum"""
         if not klines:
             return []
-        buckets = {}
-        for row in klines:
-            if row is None or len(row) < 6:
-                continue
-            ts, o, h, l, c, v = row
-            try:
-                ts = int(ts)
-                o = float(o); h = float(h); l = float(l); c = float(c); v = float(v)
-            except Exception:
-                continue
-            b = (ts // bucket_ms) * bucket_ms
-            bkt = buckets.get(b)
-            if bkt is None:
-                buckets[b] = {
-                    'open': o,
-                    'high': h,
-                    'low': l,
-                    'close': c,
-                    'volume': v,
-                    'ts_first': ts,
-                    'ts_last': ts,
-                }
-            else:
-                bkt['high'] = max(bkt['high'], h)
-                bkt['low'] = min(bkt['low'], l)
-                bkt['close'] = c
-                bkt['volume'] = (bkt['volume'] or 0) + v
-                bkt['ts_last'] = ts
-        aggregated = []
-        for b in sorted(buckets.keys()):
-            x = buckets[b]
-            aggregated.append([b, x['open'], x['high'], x['low'], x['close'], x['volume']])
-        return aggregated
+        try:
+            arr = np.asarray(klines, dtype=np.float64)
+        except (TypeError, ValueError):
+            # 存在空行/缺字段/非数值时，逐行剔除后再转换
+            rows = []
+            for row in klines:
+                if row is None or len(row) < 6:
+                    continue
+                try:
+                    rows.append([float(x) for x in row[:6]])
+                except Exception:
+                    continue
+            arr = np.asarray(rows, dtype=np.float64)
+        if arr.ndim != 2 or arr.shape[0] == 0 or arr.shape[1] < 6:
+            return []
+
+        ts = arr[:, 0].astype(np.int64)
+        if np.any(np.diff(ts) < 0):
+            order = np.argsort(ts, kind='stable')
+            arr, ts = arr[order], ts[order]
+
+        # 时间戳有序 → 同一桶的K线连续，用 reduceat 按桶边界归约
+        buckets = ts // bucket_ms
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(buckets)) + 1))
+        ends = np.append(starts[1:] - 1, len(buckets) - 1)
+
+        bucket_ts = buckets[starts] * bucket_ms
+        opens = arr[starts, 1]
+        highs = np.maximum.reduceat(arr[:, 2], starts)
+        lows = np.minimum.reduceat(arr[:, 3], starts)
+        closes = arr[ends, 4]
+        volumes = np.add.reduceat(arr[:, 5], starts)
+
+        return [
+            [b, o, h, l, c, v]
+            for b, o, h, l, c, v in zip(
+                bucket_ts.tolist(), opens.tolist(), highs.tolist(),
+                lows.tolist(), closes.tolist(), volumes.tolist(),
+            )
+        ]
 
     # 删除通用时间框架聚合函数，恢复固定 5m/20m 逻辑
     
-    def _calculate_indicators(self, df: pd.DataFrame) -> pd.DataFrame:
-        """计算技术指标"""
-        indicators = df.copy()
-        
-        # EMA
-        indicators['ema_20'] = df['close'].ewm(span=20, adjust=False).mean()
-        indicators['ema_50'] = df['close'].ewm(span=50, adjust=False).mean()
-        
-        # RSI
-        delta = df['close'].diff()
-        gain = delta.where(delta > 0, 0).rolling(window=7).mean()
-        loss = -delta.where(delta < 0, 0).rolling(window=7).mean()
-        rs = gain / loss
-        indicators['rsi_7'] = 100 - (100 / (1 + rs))
-        
-        gain14 = delta.where(delta > 0, 0).rolling(window=14).mean()
-        loss14 = -delta.where(delta < 0, 0).rolling(window=14).mean()
-        rs14 = gain14 / loss14
-        indicators['rsi_14'] = 100 - (100 / (1 + rs14))
-        
-        # MACD
-        ema12 = df['close'].ewm(span=12, adjust=False).mean()
-        ema26 = df['close'].ewm(span=26, adjust=False).mean()
-        macd_line = ema12 - ema26
-        signal_line = macd_line.ewm(span=9, adjust=False).mean()
-        indicators['macd_histogram'] = macd_line - signal_line
-        
-        # ATR
-        high_low = df['high'] - df['low']
-        high_close = abs(df['high'] - df['close'].shift())
-        low_close = abs(df['low'] - df['close'].shift())
-        tr = pd.concat([high_low, high_close, low_close], axis=1).max(axis=1)
-        indicators['atr_3'] = tr.rolling(window=3).mean()
-        indicators['atr_14'] = tr.rolling(window=14).mean()
-        
-        return indicators
+    def _calculate_indicators(self, df: pd.DataFrame) -> Dict[str, np.ndarray]:
+        """计算技术指标（EMA/RSI/MACD/ATR，由 indicators 内核一次性计算）"""
+        values = _compute_indicators_nb(
+            df['close'].to_numpy(dtype=np.float64),
+            df['high'].to_numpy(dtype=np.float64),
+            df['low'].to_numpy(dtype=np.float64),
+        )
+        return dict(zip(INDICATOR_COLUMNS, values))
 
     def _fmt_price(self, p: float) -> str:
         """根据数量级格式化价格，避免小币种被四舍五入成0/1"""
         try:
-            p = float(p)
-        except Exception:
-            return str(p)
-        if p < 0:
-            p = abs(p)
-        if p < 1:
-            return f"{p:.4f}"
-        if p < 100:
-            return f"{p:.2f}"
-        return f"{p:.1f}"
+            p = abs(float(p))
+            decade = int(math.floor(math.log10(max(p, 1e-9))))
+        except (TypeError, ValueError, OverflowError):
+            # 非数值原样输出；nan/inf 按最大数量级格式输出
+            return _FMT_BY_DECADE[_MAX_DECADE] % p if isinstance(p, float) else str(p)
+        return _FMT_BY_DECADE[min(max(decade, _MIN_DECADE), _MAX_DECADE)] % p
+
+    def _fmt_price_arr(self, arr) -> List[str]:
+        """_fmt_price 的向量化版本：按 log10 数量级查表选择格式"""
+        arr = np.abs(np.asarray(arr, dtype=np.float64))
+        decades = np.floor(np.log10(np.maximum(arr, 1e-9)))
+        decades = np.nan_to_num(decades, nan=_MAX_DECADE, posinf=_MAX_DECADE)
+        idx = np.clip(decades, _MIN_DECADE, _MAX_DECADE).astype(int) - _MIN_DECADE
+        return np.char.mod(_FMT_TABLE[idx], arr).tolist()
     
-    def get_account_info(self, market_data: Dict) -> Dict:
+    async def get_account_info(self, market_data: Dict[str, MarketSnapshot]) -> Dict:
         """获取账户信息"""
         try:
-            balance = self.exchange.fetch_balance()
+            balance = await self.exchange.fetch_balance()
             usdt_free = float(balance['USDT']['free'])
             usdt_total = float(balance['USDT']['total'])
         except Exception as e:
@@ -403,43 +694,35 @@ class CryptoAITrader:
         if self.initial_balance is None:
             self.initial_balance = usdt_total
         
-        # 获取持仓信息
+        # 获取持仓信息：SoA 数组上一次性计算全部持仓的未实现盈亏和清算价
         positions_detail = []
-        total_unrealized_pnl = 0
-        
-        for symbol, pos in self.positions.items():
-            coin = symbol.split('/')[0]
-            if coin not in market_data:
-                continue
-            
-            current_price = market_data[coin]['current_price']
-            
-            # 计算未实现盈亏
-            if pos['side'] == 'long':
-                unrealized_pnl = (current_price - pos['entry_price']) * pos['quantity']
-            else:
-                unrealized_pnl = (pos['entry_price'] - current_price) * pos['quantity']
-            
-            total_unrealized_pnl += unrealized_pnl
-            
-            # 计算清算价格
-            if pos['side'] == 'long':
-                liquidation = pos['entry_price'] * (1 - 1/pos['leverage'] * 0.9)
-            else:
-                liquidation = pos['entry_price'] * (1 + 1/pos['leverage'] * 0.9)
-            
+        book = self._position_book
+        coins = [self._coin_by_symbol[symbol] for symbol in self._position_symbols]
+        has_price = np.array([coin in market_data for coin in coins], dtype=bool)
+        current_prices = np.array(
+            [market_data[coin].current_price if coin in market_data else np.nan for coin in coins],
+            dtype=np.float64,
+        )
+
+        unrealized = book['side_sign'] * (current_prices - book['entry_price']) * book['quantity']
+        liquidation = book['entry_price'] * (1 - book['side_sign'] / book['leverage'] * 0.9)
+        total_unrealized_pnl = float(unrealized[has_price].sum())
+
+        for i in np.flatnonzero(has_price):
+            pos = self.positions[self._position_symbols[i]]
+            current_price = float(current_prices[i])
             positions_detail.append({
-                'symbol': coin,
-                'quantity': pos['quantity'],
-                'entry_price': pos['entry_price'],
+                'symbol': coins[i],
+                'quantity': pos.quantity,
+                'entry_price': pos.entry_price,
                 'current_price': current_price,
-                'liquidation_price': round(liquidation, 2),
-                'unrealized_pnl': round(unrealized_pnl, 2),
-                'leverage': pos['leverage'],
-                'exit_plan': pos.get('exit_plan', {}),
-                'confidence': pos.get('confidence', 0.65),
-                'risk_usd': pos.get('risk_usd', 0),
-                'notional_usd': round(current_price * pos['quantity'], 2),
+                'liquidation_price': round(float(liquidation[i]), 2),
+                'unrealized_pnl': round(float(unrealized[i]), 2),
+                'leverage': pos.leverage,
+                'exit_plan': asdict(pos.exit_plan),
+                'confidence': pos.confidence,
+                'risk_usd': pos.risk_usd,
+                'notional_usd': round(current_price * pos.quantity, 2),
             })
         
         total_value = usdt_total + total_unrealized_pnl
@@ -454,25 +737,76 @@ class CryptoAITrader:
             'total_unrealized_pnl': round(total_unrealized_pnl, 2),
         }
     
+    def _sync_position_book(self):
+        """持仓增删后重建 SoA 数组，行顺序与 self.positions 一致（保留已有持仓的标记价）"""
+        marks = dict(zip(self._position_symbols, self._position_book['mark_price'].tolist()))
+        self._position_symbols = list(self.positions)
+        self._position_index = {symbol: i for i, symbol in enumerate(self._position_symbols)}
+        book = np.empty(len(self._position_symbols), dtype=_POSITION_DTYPE)
+        for i, (symbol, pos) in enumerate(self.positions.items()):
+            book[i] = (
+                pos.entry_price,
+                pos.quantity,
+                pos.leverage,
+                1.0 if pos.side == 'long' else -1.0,
+                _exit_level(pos.exit_plan.stop_loss),
+                _exit_level(pos.exit_plan.profit_target),
+                marks.get(symbol, math.nan),
+            )
+        self._position_book = book
+
+    def _mark_price(self, symbol: str, price: float):
+        """写入持仓合约的最新价（无持仓时忽略）"""
+        i = self._position_index.get(symbol)
+        if i is not None:
+            self._position_book['mark_price'][i] = price
+
+    def _welford_update(self, pnl_pct: float):
+        """平仓收益率计入运行均值/方差（Welford 算法）"""
+        self._pnl_n += 1
+        delta = pnl_pct - self._pnl_mean
+        self._pnl_mean += delta / self._pnl_n
+        self._pnl_m2 += delta * (pnl_pct - self._pnl_mean)
+
     def _calculate_sharpe(self) -> float:
-        """计算夏普比率"""
-        if len(self.trade_history) < 2:
+        """计算夏普比率（O(1)，基于运行统计量；标准差口径与 np.std 一致）"""
+        if self._pnl_n < 2:
             return 0.0
-        returns = [t.get('pnl_pct', 0) for t in self.trade_history]
-        if not returns:
-            return 0.0
-        return np.mean(returns) / (np.std(returns) + 1e-10)
+        return self._pnl_mean / (math.sqrt(self._pnl_m2 / self._pnl_n) + 1e-10)
     
     # ========== AI决策 (DeepSeek-V3) ==========
     
-    def get_ai_decision(self, market_data: Dict, account_info: Dict) -> Dict:
-        """获取 DeepSeek-V3 的交易决策"""
+    async def get_ai_decision(self, market_data: Dict[str, MarketSnapshot], account_info: Dict) -> Dict:
+        """
+        获取 DeepSeek-V3 的交易决策
+
+        所有币种合并为一次请求；超过 _AI_BATCH_SIZE 个时均分为若干子批次并发请求，
+        总耗时取决于最慢的一批，而不是逐个币种串行。
+        """
+        coins = list(market_data)
+        n_batches = max(1, math.ceil(len(coins) / _AI_BATCH_SIZE))
+        batch_size = max(1, math.ceil(len(coins) / n_batches))
+        batches = [
+            {coin: market_data[coin] for coin in coins[i:i + batch_size]}
+            for i in range(0, len(coins), batch_size)
+        ] or [market_data]
+
+        self.logger.info("正在请求 DeepSeek-V3 决策（%d 个请求）...", len(batches))
+        results = await asyncio.gather(*(self._request_decision(batch, account_info) for batch in batches))
+
+        # 只保留各批自身的币种：提示词示例中的 BTC/ETH 可能被其他批次照抄返回，不能覆盖真实决策
+        decision: Dict[str, Dict] = {}
+        for batch, part in zip(batches, results):
+            decision.update({coin: d for coin, d in part.items() if coin in batch})
+        self.logger.info("✅ DeepSeek-V3 决策完成，涉及 %d 个币种", len(decision))
+        return decision
+
+    async def _request_decision(self, market_data: Dict[str, MarketSnapshot], account_info: Dict) -> Dict:
+        """请求一批币种的决策（JSON 对象输出模式）"""
         prompt = self._build_prompt(market_data, account_info)
-        
+
         try:
-            self.logger.info("正在请求 DeepSeek-V3 决策...")
-            
-            response = self.ai_client.chat.completions.create(
+            stream = await self.ai_client.chat.completions.create(
                 model=self.ai_model,
                 messages=[
                     {"role": "system", "content": "你是一个专业的加密货币合约交易AI系统。"},
@@ -480,18 +814,18 @@ class CryptoAITrader:
                 ],
                 temperature=0.1,
                 max_tokens=4096,
+                response_format={"type": "json_object"},
+                stream=True,
             )
-            
-            raw_response = response.choices[0].message.content
+
+            raw_response = await self._read_json_stream(stream)
             decision = self._parse_decision(raw_response)
 
             # 调试：打印原始响应（帮助诊断问题）
-            if len(decision) < len(self.symbols):
-                self.logger.warning(f"⚠️ AI 只决策了 {len(decision)} 个币种，预期 {len(self.symbols)} 个")
-                self.logger.debug(f"AI 原始响应:\n{raw_response[:500]}")  # 打印前 500 字符
-                self.logger.debug(f"解析后决策: {decision}")
-
-            self.logger.info(f"✅ DeepSeek-V3 决策完成，涉及 {len(decision)} 个币种")
+            if len(decision) < len(market_data):
+                self.logger.warning("⚠️ AI 只决策了 %d 个币种，预期 %d 个", len(decision), len(market_data))
+                self.logger.debug("AI 原始响应:\n%s", raw_response[:500])  # 打印前 500 字符
+                self.logger.debug("解析后决策: %s", decision)
 
             return decision
             
@@ -499,51 +833,53 @@ class CryptoAITrader:
             self.logger.error(f"AI决策失败: {e}")
             return {}
     
-    def _build_prompt(self, market_data: Dict, account_info: Dict) -> str:
-        """构建提示词（支持严格/自由两种风格）"""
-
-        # 获取历史交易和上一笔交易逻辑
-        all_trades = self.risk_manager.get_all_trades()
-        last_trade_logic = self.risk_manager.get_last_trade_logic()
-        open_trades = self.risk_manager.get_open_trades()
-        month_stats = self.risk_manager.get_month_stats()
-
-        # 格式化交易历史（最近5笔）
-        recent_trades_text = ""
-        if all_trades:
-            for trade in all_trades[-5:]:
-                result = "✓" if trade.get('pnl', 0) > 0 else "✗"
-                recent_trades_text += f"  {result} {trade['coin']}: {trade['signal']} @ {trade['entry_price']:.2f}, 止损:{trade['stop_loss']:.2f}, 结构:{trade.get('structure', 'N/A')}\n"
-        else:
-            recent_trades_text = "  (无历史交易)"
-
-        # 格式化当前持仓
-        open_trades_text = ""
-        if open_trades:
-            for trade in open_trades:
-                open_trades_text += f"  {trade['coin']}: 入场{trade['entry_price']:.2f}, 止损{trade['stop_loss']:.2f}, 杠杆{trade['leverage']}x\n"
-        else:
-            open_trades_text = "  (无持仓)"
-
-        # 格式化市场数据
-        market_summary = []
-        for coin, data in market_data.items():
-            mid_series = [self._fmt_price(x) for x in data['minute_series']['mid_price'][-10:]]
-            rsi7_series = [f"{float(x):.1f}" for x in data['minute_series']['rsi_7'][-10:]]
-            summary = f"""
-【{coin} 市场分析】
-价格: {self._fmt_price(data['current_price'])} | 20日EMA: {self._fmt_price(data['current_ema_20'])} | RSI(7): {data['current_rsi_7']:.1f}
+    async def _read_json_stream(self, stream) -> str:
+        """
+        流式读取 AI 响应
+
+        边接收边跟踪括号深度（跳过字符串内的括号），顶层 JSON 闭合后立即停止读取，
+        不必等待其后的 markdown 结尾或多余文本。
+        """
+        parts = []
+        depth = 0
+        started = False
+        in_string = False
+        escaped = False
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                text = chunk.choices[0].delta.content
+                if not text:
+                    continue
+                parts.append(text)
+
+                for i, ch in enumerate(text):
+                    if in_string:
+                        if escaped:
+                            escaped = False
+                        elif ch == '\\':
+                            escaped = True
+                        elif ch == '"':
+                            in_string = False
+                    elif ch == '"':
+                        in_string = started
+                    elif ch in '{[':
+                        depth += 1
+                        started = True
+                    elif ch in '}]' and started:
+                        depth -= 1
+                        if depth == 0:
+                            parts[-1] = text[:i + 1]
+                            return ''.join(parts)
+        finally:
+            await stream.close()
 
-5分钟K线序列（最近10根）：
-  价格: {mid_series}
-  RSI-7: {rsi7_series}
+        return ''.join(parts)
 
-20分钟周期背景（趋势判定）：
-  EMA-20: {self._fmt_price(data['trend_context']['ema_20'])} vs EMA-50: {self._fmt_price(data['trend_context']['ema_50'])}
-  波动率(ATR-3): {self._fmt_price(data['trend_context']['atr_3'])} | 资金费率: {data['funding_rate']:.6f}
-"""
-            market_summary.append(summary)
-        prompt = f"""你是一个使用【价格行为 + 订单流 + 缠论】的专业交易AI。
+    def _build_prompt_templates(self) -> Tuple[str, str]:
+        """构建提示词中不随行情变化的头部与尾部（尾部为 str.format 模板）"""
+        header = """你是一个使用【价格行为 + 订单流 + 缠论】的专业交易AI。
 
 ================== 核心交易框架 ==================
 1. 趋势周期(20分钟K线)：判断大方向，只顺应主趋势
@@ -553,21 +889,8 @@ class CryptoAITrader:
    ⚠️ 【硬限制】单笔最高2%亏损 + 月度最高6%累积亏损（两个都不能突破）
 
 ================== 账户状态 ==================
-账户余额: ${account_info['account_balance']:.2f}
-可用资金: ${account_info['available_cash']:.2f}
-月度初始资金: ${month_stats.get('initial_balance', 0):.2f}
-月度回撤硬止损: ${month_stats.get('drawdown_limit', 0):.2f}
-当月已交易: {month_stats.get('total_trades', 0)}笔 (胜率: {month_stats.get('win_rate', 0):.1f}%)
-当月已亏: ${month_stats.get('initial_balance', 0) - account_info['account_balance']:.2f} (离6%限额还有 ${month_stats.get('drawdown_limit', 0) - account_info['account_balance']:.2f})
-
-当前持仓:
-{open_trades_text}
-
-================== 上一笔交易逻辑（记忆中） ==================
-{f"币种: {last_trade_logic.get('coin')}, 信号: {last_trade_logic.get('signal')}, 结构: {last_trade_logic.get('structure', 'N/A')}, 置信度: {last_trade_logic.get('confidence', 0)}, 风险: {last_trade_logic.get('risk_usd', 0):.0f}USD" if last_trade_logic else "(首笔交易)"}
-
-================== 市场数据 ==================
-{''.join(market_summary)}
+"""
+        footer = """
 
 ================== 你的决策任务 ==================
 
@@ -583,8 +906,8 @@ class CryptoAITrader:
 5. 根据止损距离 → 计算杠杆和仓位 (公式: quantity = risk_usd / (entry_price × stop_loss_distance_pct))
 
 【硬性约束 - 必须遵守】
-⛔ 单笔亏损不能超过 ${account_info['account_balance'] * 0.02:.2f}（账户2%）
-⛔ 月度累积亏损不能超过 ${month_stats.get('drawdown_limit', 0):.2f}（月初资金的6%）
+⛔ 单笔亏损不能超过 ${max_risk_usd:.2f}（账户2%）
+⛔ 月度累积亏损不能超过 ${drawdown_limit:.2f}（月初资金的6%）
 ⛔ 结构未破，不操作
 ⛔ 无明显趋势，不操作
 
@@ -595,7 +918,7 @@ class CryptoAITrader:
 ✅ 是否操作：可以 HOLD 观望，不是必须交易
 
 【返回格式 - JSON（不要markdown，必须返回所有币种；严格：返回单个 JSON 对象，非数组）】
-为监控的所有币种都返回决策（包括 BTC, ETH, XRP, BNB, SOL, DOGE, ADA, TRX, AVAX, LINK）：
+为以上市场数据中的所有币种都返回决策（包括 {coins}）：
 
 {{
     "BTC": {{
@@ -639,8 +962,94 @@ class CryptoAITrader:
 - 如果行情复杂或结构不清或置信度过低，返回 signal: "hold" + 简短说明即可
 - 宁可少赚也不要乱干，这是生存的第一原则
 """
+        return header, footer
+
+    def _render_coin_section(self, coin: str, data: MarketSnapshot) -> str:
+        """
+        渲染单个币种的市场分析段落（LRU 缓存）
+
+        以 (币种, 最新5m K线时间, 价格, 资金费率) 为粗粒度指纹：
+        行情静止时直接复用上一轮格式化好的字符串。
+        """
+        key = (coin, data.last_bar_ts, round(data.current_price, 4), data.funding_rate)
+        cached = self._coin_section_cache.get(key)
+        if cached is not None:
+            self._coin_section_cache.move_to_end(key)
+            return cached
+
+        mid_series = self._fmt_price_arr(data.minute_series['mid_price'][-10:])
+        rsi7_series = np.char.mod('%.1f', np.asarray(data.minute_series['rsi_7'][-10:], dtype=np.float64)).tolist()
+        section = f"""
+【{coin} 市场分析】
+价格: {self._fmt_price(data.current_price)} | 20日EMA: {self._fmt_price(data.current_ema_20)} | RSI(7): {data.current_rsi_7:.1f}
+
+5分钟K线序列（最近10根）：
+  价格: {mid_series}
+  RSI-7: {rsi7_series}
+
+20分钟周期背景（趋势判定）：
+  EMA-20: {self._fmt_price(data.trend_context['ema_20'])} vs EMA-50: {self._fmt_price(data.trend_context['ema_50'])}
+  波动率(ATR-3): {self._fmt_price(data.trend_context['atr_3'])} | 资金费率: {data.funding_rate:.6f}
+"""
+
+        self._coin_section_cache[key] = section
+        if len(self._coin_section_cache) > 256:
+            self._coin_section_cache.popitem(last=False)
+        return section
+
+    def _build_prompt(self, market_data: Dict[str, MarketSnapshot], account_info: Dict) -> str:
+        """构建提示词（静态头尾预先生成，仅拼接动态部分）"""
+
+        # 获取历史交易和上一笔交易逻辑
+        last_trade_logic = self.risk_manager.get_last_trade_logic()
+        open_trades = self.risk_manager.get_open_trades()
+        month_stats = self.risk_manager.get_month_stats()
+
+        parts = [self._prompt_static_header]
 
-        return prompt
+        # 账户状态
+        parts.append(
+            f"""账户余额: ${account_info['account_balance']:.2f}
+可用资金: ${account_info['available_cash']:.2f}
+月度初始资金: ${month_stats.get('initial_balance', 0):.2f}
+月度回撤硬止损: ${month_stats.get('drawdown_limit', 0):.2f}
+当月已交易: {month_stats.get('total_trades', 0)}笔 (胜率: {month_stats.get('win_rate', 0):.1f}%)
+当月已亏: ${month_stats.get('initial_balance', 0) - account_info['account_balance']:.2f} (离6%限额还有 ${month_stats.get('drawdown_limit', 0) - account_info['account_balance']:.2f})
+
+当前持仓:
+"""
+        )
+
+        # 当前持仓
+        if open_trades:
+            for trade in open_trades:
+                parts.append(f"  {trade['coin']}: 入场{trade['entry_price']:.2f}, 止损{trade['stop_loss']:.2f}, 杠杆{trade['leverage']}x\n")
+        else:
+            parts.append("  (无持仓)")
+
+        # 上一笔交易逻辑
+        parts.append("\n\n================== 上一笔交易逻辑（记忆中） ==================\n")
+        if last_trade_logic:
+            parts.append(
+                f"币种: {last_trade_logic.get('coin')}, 信号: {last_trade_logic.get('signal')}, "
+                f"结构: {last_trade_logic.get('structure', 'N/A')}, 置信度: {last_trade_logic.get('confidence', 0)}, "
+                f"风险: {last_trade_logic.get('risk_usd', 0):.0f}USD"
+            )
+        else:
+            parts.append("(首笔交易)")
+
+        # 市场数据
+        parts.append("\n\n================== 市场数据 ==================\n")
+        for coin, data in market_data.items():
+            parts.append(self._render_coin_section(coin, data))
+
+        parts.append(self._prompt_static_footer.format(
+            max_risk_usd=account_info['account_balance'] * 0.02,
+            drawdown_limit=month_stats.get('drawdown_limit', 0),
+            coins=', '.join(market_data),
+        ))
+
+        return ''.join(parts)
     
     def _parse_decision(self, response: str) -> Dict:
         """解析AI决策"""
@@ -651,7 +1060,7 @@ class CryptoAITrader:
                 end = response.rfind('}') + 1
                 response = response[start:end]
             
-            decisions = json.loads(response)
+            decisions = _json_loads(response)
 
             # 兼容返回为 [ {"BTC": {...}}, {"ETH": {...}}, ... ] 的数组格式
             if isinstance(decisions, list):
@@ -681,202 +1090,342 @@ class CryptoAITrader:
     
     # ========== 交易执行 ==========
     
-    def execute_decisions(self, decisions: Dict, market_data: Dict, account_info: Dict):
-        """执行交易决策"""
+    async def execute_decisions(self, decisions: Dict, market_data: Dict[str, MarketSnapshot], account_info: Dict,
+                                cycle_ts: int):
+        """执行交易决策（cycle_ts 为本轮统一时间戳，避免每笔交易重复取系统时间）"""
         self.logger.info("\n" + "="*60)
         self.logger.info("开始执行交易决策")
         self.logger.info("="*60)
-        
-        for coin, decision in decisions.items():
-            try:
-                signal = decision.get('signal', 'hold')
-                
-                self.logger.info(f"\n{coin}: {signal.upper()}")
-                self.logger.info(f"置信度: {decision.get('confidence', 0)*100:.0f}%")
-                self.logger.info(f"理由: {decision.get('justification', 'N/A')[:100]}")
-                
-                if signal == 'hold':
-                    self._check_existing_position(coin, decision, market_data)
-                elif signal == 'buy':
-                    self._execute_buy(coin, decision, market_data, account_info)
-                elif signal == 'sell':
-                    self._execute_sell(coin, decision, market_data)
-                
-                time.sleep(0.2)
-                
-            except Exception as e:
-                self.logger.error(f"执行 {coin} 决策失败: {e}")
-    
-    def _execute_buy(self, coin: str, decision: Dict, market_data: Dict, account_info: Dict):
-        """执行买入（OKX 模拟盘）"""
-        # 根据交易所类型转换符号
-        symbol = self._convert_symbol(f"{coin}/USDT")
 
-        if symbol in self.positions:
-            self.logger.info(f"已持有 {coin}，跳过")
-            return
+        # 先并发完成各币种的风控校验与杠杆设置，得到待下单列表
+        intents = await asyncio.gather(*(
+            self._prepare_decision(coin, decision, market_data, account_info, cycle_ts)
+            for coin, decision in decisions.items()
+        ))
 
+        # 所有市价单合并为批量下单，一次请求提交
+        await self._submit_orders([intent for intent in intents if intent], cycle_ts)
+
+    async def _prepare_decision(self, coin: str, decision: Dict, market_data: Dict[str, MarketSnapshot],
+                                account_info: Dict, cycle_ts: int) -> Optional[Dict]:
+        """处理单个币种的决策，需要下单时返回下单意图"""
         try:
-            current_price = market_data[coin]['current_price']
-            leverage = decision.get('leverage', 3)
-            quantity = decision.get('quantity', 0)
-            risk_usd = decision.get('risk_usd', 0)
+            signal = decision.get('signal', 'hold')
 
-            if quantity <= 0:
-                self.logger.warning(f"{coin} 数量无效: {quantity}")
-                return
+            self.logger.info(
+                "\n%s: %s\n置信度: %.0f%%\n理由: %s",
+                coin, signal.upper(), decision.get('confidence', 0) * 100,
+                decision.get('justification', 'N/A')[:100],
+            )
 
-            # 【硬限制检查 1】单笔风险不能超过账户 2%
-            max_risk_per_trade = account_info['account_balance'] * 0.02
-            if risk_usd > max_risk_per_trade:
-                self.logger.warning(f"⛔ {coin} 风险 ${risk_usd:.2f} 超过单笔限制 ${max_risk_per_trade:.2f}，拒绝执行")
-                return
+            if signal == 'hold':
+                await self._check_existing_position(coin, decision, market_data[coin], cycle_ts)
+            elif signal == 'buy':
+                return await self._prepare_buy(coin, decision, market_data[coin], account_info, cycle_ts)
+            elif signal == 'sell':
+                return self._prepare_sell(coin, decision, market_data[coin].current_price, cycle_ts)
 
-            # 【硬限制检查 2】月度累积亏损 + 本笔风险 不能超过月度限额
-            month_stats = self.risk_manager.get_month_stats()
-            current_month_loss = month_stats.get('initial_balance', account_info['account_balance']) - account_info['account_balance']
-            remaining_loss_budget = month_stats.get('drawdown_limit', account_info['account_balance'] * 0.94) - account_info['account_balance'] + current_month_loss
+        except Exception as e:
+            self.logger.error(f"执行 {coin} 决策失败: {e}")
+        return None
 
-            if risk_usd > remaining_loss_budget:
-                self.logger.warning(f"⛔ {coin} 风险 ${risk_usd:.2f} 超过月度剩余预算 ${remaining_loss_budget:.2f}，拒绝执行")
-                return
+    def _client_order_id(self, side: str, coin: str, cycle_ts: int) -> str:
+        """批量下单回报按客户端订单号对应到币种（OKX 要求 1-32 位字母数字）"""
+        return f"ai{side[0]}{coin}{cycle_ts // 1_000_000}"[:32]
 
-            # 资金与杠杆（合约：保证金 = 名义价值 / 杠杆）
-            notional_value = current_price * quantity
-            margin_required = notional_value / max(leverage, 1)
-            if margin_required > account_info['available_cash'] * 0.98:
-                self.logger.warning(f"{coin} 保证金不足: 需要${margin_required:.2f}，可用${account_info['available_cash']:.2f}")
-                return
+    async def _submit_orders(self, intents: List[Dict], cycle_ts: int):
+        """按批提交市价单（OKX 每批最多 _ORDER_BATCH_SIZE 笔），再逐笔处理成交回报"""
+        if not intents:
+            return
+        batches = [intents[i:i + _ORDER_BATCH_SIZE] for i in range(0, len(intents), _ORDER_BATCH_SIZE)]
+        await asyncio.gather(*(self._submit_batch(batch, cycle_ts) for batch in batches))
 
-            # 设置杠杆与逐仓
+    async def _submit_batch(self, batch: List[Dict], cycle_ts: int):
+        """提交一批订单并处理回报"""
+        try:
+            if len(batch) == 1:
+                request = batch[0]['request']
+                orders = [await self.exchange.create_order(
+                    request['symbol'], request['type'], request['side'], request['amount'],
+                    params=request['params'],
+                )]
+            else:
+                orders = await self.exchange.create_orders([intent['request'] for intent in batch])
+        except Exception as e:
+            label = "下单失败" if len(batch) == 1 else "批量下单失败"
+            self.logger.error(f"{label}（{', '.join(intent['coin'] for intent in batch)}）: {e}")
+            for intent in batch:
+                if intent['side'] == 'sell':
+                    await self._on_close_failed(intent['symbol'])
+                self._closing.discard(intent['symbol'])
+            return
+
+        orders_by_cid = {order.get('clientOrderId'): order for order in orders}
+        for i, intent in enumerate(batch):
+            # 优先按客户端订单号对应，缺失时按提交顺序
+            order = orders_by_cid.get(intent['request']['params']['clientOrderId'])
+            if order is None and i < len(orders):
+                order = orders[i]
             try:
-                if self.exchange_type == 'okx':
-                    self.exchange.set_leverage(leverage, symbol, params={'marginMode': 'isolated', 'posSide': 'long'})
+                if order is None or order.get('status') == 'rejected':
+                    reason = (order or {}).get('info', {}).get('sMsg', '无回报')
+                    action = '买入' if intent['side'] == 'buy' else '卖出'
+                    self.logger.error(f"{action} {intent['coin']} 失败: {reason}")
+                    if intent['side'] == 'sell':
+                        await self._on_close_failed(intent['symbol'])
+                elif intent['side'] == 'buy':
+                    await self._on_buy_filled(intent, order, cycle_ts)
                 else:
-                    self.exchange.set_leverage(leverage, symbol)
-                    self.exchange.set_margin_type('isolated', symbol)
+                    await self._on_sell_filled(intent, cycle_ts)
             except Exception as e:
-                self.logger.warning(f"设置杠杆或保证金模式失败: {e}")
+                self.logger.error(f"处理 {intent['coin']} 成交回报失败: {e}")
+            finally:
+                self._closing.discard(intent['symbol'])
+    
+    async def _prepare_buy(self, coin: str, decision: Dict, snapshot: MarketSnapshot, account_info: Dict,
+                           cycle_ts: int) -> Optional[Dict]:
+        """买入前校验并设置杠杆，返回买入意图（OKX 模拟盘）"""
+        # 根据交易所类型转换符号
+        symbol = self._symbol_by_coin[coin]
 
-            # 下市价单
-            params = {}
-            if self.exchange_type == 'okx':
-                params = {'tdMode': 'isolated', 'posSide': 'long'}
-            order = self.exchange.create_market_buy_order(symbol, quantity, params=params)
-            
-            self.logger.info(f"✅ 买入成功: {quantity} {coin} @ ${current_price:.2f}")
-            
-            # 记录持仓
-            self.positions[symbol] = {
-                'coin': coin,
-                'side': 'long',
-                'quantity': quantity,
-                'entry_price': current_price,
-                'leverage': leverage,
-                'risk_usd': decision.get('risk_usd', 0),
-                'confidence': decision.get('confidence', 0.65),
-                'exit_plan': {
-                    'profit_target': decision.get('profit_target'),
-                    'stop_loss': decision.get('stop_loss'),
-                    'invalidation_condition': decision.get('invalidation_condition')
-                },
-                'entry_time': datetime.now(),
-                'entry_order_id': order['id'],
-            }
+        if symbol in self.positions:
+            self.logger.info("已持有 %s，跳过", coin)
+            return None
 
-            # 【关键】记录交易到风险管理器（保存交易历史和逻辑）
-            self.risk_manager.record_trade({
-                'timestamp': datetime.now().isoformat(),
-                'coin': coin,
-                'signal': 'buy',
-                'entry_price': current_price,
-                'quantity': quantity,
-                'leverage': leverage,
-                'stop_loss': decision.get('stop_loss'),
-                'profit_target': decision.get('profit_target'),
-                'entry_logic': decision.get('justification', ''),
-                'structure': decision.get('structure', 'N/A'),
-                'confidence': decision.get('confidence', 0.65),
-                'risk_usd': decision.get('risk_usd', 0)
-            })
+        current_price = snapshot.current_price
+        leverage = decision.get('leverage', 3)
+        quantity = decision.get('quantity', 0)
+        risk_usd = decision.get('risk_usd', 0)
 
-            # 服务器端止损/止盈（若提供）
-            self._set_stop_orders(symbol, decision, quantity)
-            
-        except Exception as e:
-            self.logger.error(f"买入 {coin} 失败: {e}")
-    
-    def _execute_sell(self, coin: str, decision: Dict, market_data: Dict):
-        """执行卖出/平仓（OKX 模拟盘）"""
-        symbol = self._convert_symbol(f"{coin}/USDT")
+        if quantity <= 0:
+            self.logger.warning(f"{coin} 数量无效: {quantity}")
+            return None
 
-        if symbol not in self.positions:
-            self.logger.info(f"未持有 {coin}，无需卖出")
-            return
+        # 【硬限制检查 1】单笔风险不能超过账户 2%
+        max_risk_per_trade = account_info['account_balance'] * 0.02
+        if risk_usd > max_risk_per_trade:
+            self.logger.warning("⛔ %s 风险 $%.2f 超过单笔限制 $%.2f，拒绝执行", coin, risk_usd, max_risk_per_trade)
+            return None
 
-        try:
-            position = self.positions[symbol]
-            current_price = market_data[coin]['current_price']
+        # 【硬限制检查 2】月度累积亏损 + 本笔风险 不能超过月度限额
+        month_stats = self.risk_manager.get_month_stats()
+        current_month_loss = month_stats.get('initial_balance', account_info['account_balance']) - account_info['account_balance']
+        remaining_loss_budget = month_stats.get('drawdown_limit', account_info['account_balance'] * 0.94) - account_info['account_balance'] + current_month_loss
 
-            # 平仓（reduceOnly）
-            params = {'reduceOnly': True}
+        if risk_usd > remaining_loss_budget:
+            self.logger.warning("⛔ %s 风险 $%.2f 超过月度剩余预算 $%.2f，拒绝执行", coin, risk_usd, remaining_loss_budget)
+            return None
+
+        # 资金与杠杆（合约：保证金 = 名义价值 / 杠杆）
+        notional_value = current_price * quantity
+        margin_required = notional_value / max(leverage, 1)
+        if margin_required > account_info['available_cash'] * 0.98:
+            self.logger.warning("%s 保证金不足: 需要$%.2f，可用$%.2f", coin, margin_required, account_info['available_cash'])
+            return None
+
+        # 设置杠杆与逐仓
+        try:
             if self.exchange_type == 'okx':
-                params.update({'tdMode': 'isolated', 'posSide': 'long'})
-            order = self.exchange.create_market_sell_order(symbol, position['quantity'], params=params)
-            
-            # 计算盈亏
-            pnl = (current_price - position['entry_price']) * position['quantity']
-            pnl_pct = (current_price / position['entry_price'] - 1) * 100 * position['leverage']
-            
-            self.logger.info(f"✅ 卖出成功: {position['quantity']} {coin} @ ${current_price:.2f}")
-            self.logger.info(f"   盈亏: ${pnl:+.2f} ({pnl_pct:+.2f}%)")
-            
-            # 记录交易历史
-            self.trade_history.append({
-                'coin': coin,
-                'side': 'close_long',
-                'quantity': position['quantity'],
-                'entry_price': position['entry_price'],
-                'exit_price': current_price,
-                'pnl': pnl,
-                'pnl_pct': pnl_pct,
-                'hold_hours': (datetime.now() - position['entry_time']).total_seconds() / 3600,
-                'reason': decision.get('justification', ''),
-                'timestamp': datetime.now()
-            })
-            
-            # 取消服务器端止损/止盈单
-            self._cancel_stop_orders(symbol)
-            
-            # 删除持仓
-            del self.positions[symbol]
-            
+                await self.exchange.set_leverage(leverage, symbol, params={'marginMode': 'isolated', 'posSide': 'long'})
+            else:
+                await self.exchange.set_leverage(leverage, symbol)
+                await self.exchange.set_margin_type('isolated', symbol)
         except Exception as e:
-            self.logger.error(f"卖出 {coin} 失败: {e}")
+            self.logger.warning(f"设置杠杆或保证金模式失败: {e}")
+
+        # 市价单参数
+        params = {'clientOrderId': self._client_order_id('buy', coin, cycle_ts)}
+        if self.exchange_type == 'okx':
+            params.update({'tdMode': 'isolated', 'posSide': 'long'})
+
+        return {
+            'coin': coin,
+            'symbol': symbol,
+            'side': 'buy',
+            'decision': decision,
+            'price': current_price,
+            'quantity': quantity,
+            'leverage': leverage,
+            'request': {'symbol': symbol, 'type': 'market', 'side': 'buy', 'amount': quantity, 'params': params},
+        }
+
+    async def _on_buy_filled(self, intent: Dict, order: Dict, cycle_ts: int):
+        """买单成交后记录持仓、交易日志与止损/止盈"""
+        coin, symbol, decision = intent['coin'], intent['symbol'], intent['decision']
+        current_price, quantity, leverage = intent['price'], intent['quantity'], intent['leverage']
+
+        self.logger.info("✅ 买入成功: %s %s @ $%.2f", quantity, coin, current_price)
+        
+        # 记录持仓
+        self.positions[symbol] = Position(
+            coin=coin,
+            side='long',
+            quantity=quantity,
+            entry_price=current_price,
+            leverage=leverage,
+            risk_usd=decision.get('risk_usd', 0),
+            confidence=decision.get('confidence', 0.65),
+            exit_plan=ExitPlan(
+                profit_target=decision.get('profit_target'),
+                stop_loss=decision.get('stop_loss'),
+                invalidation_condition=decision.get('invalidation_condition'),
+            ),
+            entry_time_ns=cycle_ts,
+            entry_order_id=order['id'],
+        )
+        self._sync_position_book()
+
+        # 【关键】记录交易到风险管理器（保存交易历史和逻辑）
+        self.risk_manager.record_trade({
+            'timestamp': cycle_ts,
+            'coin': coin,
+            'signal': 'buy',
+            'entry_price': current_price,
+            'quantity': quantity,
+            'leverage': leverage,
+            'stop_loss': decision.get('stop_loss'),
+            'profit_target': decision.get('profit_target'),
+            'entry_logic': decision.get('justification', ''),
+            'structure': decision.get('structure', 'N/A'),
+            'confidence': decision.get('confidence', 0.65),
+            'risk_usd': decision.get('risk_usd', 0)
+        })
+
+        # 服务器端止损/止盈（若提供）
+        self._set_stop_orders(symbol, decision, quantity)
     
-    def _check_existing_position(self, coin: str, decision: Dict, market_data: Dict):
-        """检查现有持仓"""
-        symbol = self._convert_symbol(f"{coin}/USDT")
+    def _prepare_sell(self, coin: str, decision: Dict, current_price: float, cycle_ts: int) -> Optional[Dict]:
+        """返回平仓意图并标记为平仓中（OKX 模拟盘）"""
+        symbol = self._symbol_by_coin[coin]
 
         if symbol not in self.positions:
-            return
+            self.logger.info("未持有 %s，无需卖出", coin)
+            return None
+        if symbol in self._closing:
+            self.logger.info("%s 正在平仓，跳过", coin)
+            return None
 
         position = self.positions[symbol]
-        current_price = market_data[coin]['current_price']
 
-        # 检查止损
-        if position['exit_plan'].get('stop_loss'):
-            if current_price <= position['exit_plan']['stop_loss']:
-                self.logger.warning(f"⚠️ {coin} 触发止损!")
-                self._execute_sell(coin, {'justification': '触发止损'}, market_data)
-                return
+        # 平仓（reduceOnly）
+        params = {'reduceOnly': True, 'clientOrderId': self._client_order_id('sell', coin, cycle_ts)}
+        if self.exchange_type == 'okx':
+            params.update({'tdMode': 'isolated', 'posSide': 'long'})
 
-        # 检查止盈
-        if position['exit_plan'].get('profit_target'):
-            if current_price >= position['exit_plan']['profit_target']:
-                self.logger.info(f"🎯 {coin} 触发止盈!")
-                self._execute_sell(coin, {'justification': '触发止盈'}, market_data)
-                return
+        self._closing.add(symbol)
+        return {
+            'coin': coin,
+            'symbol': symbol,
+            'side': 'sell',
+            'decision': decision,
+            'price': current_price,
+            'quantity': position.quantity,
+            'request': {
+                'symbol': symbol, 'type': 'market', 'side': 'sell',
+                'amount': position.quantity, 'params': params,
+            },
+        }
+
+    async def _on_sell_filled(self, intent: Dict, cycle_ts: int):
+        """平仓成交后计算盈亏、撤销条件单并移除持仓"""
+        coin, symbol, decision = intent['coin'], intent['symbol'], intent['decision']
+        position = self.positions[symbol]
+        current_price = intent['price']
+
+        # 计算盈亏
+        pnl = (current_price - position.entry_price) * position.quantity
+        pnl_pct = (current_price / position.entry_price - 1) * 100 * position.leverage
+        
+        self.logger.info("✅ 卖出成功: %s %s @ $%.2f", position.quantity, coin, current_price)
+        self.logger.info("   盈亏: $%+.2f (%+.2f%%)", pnl, pnl_pct)
+        
+        # 取消服务器端止损/止盈单
+        await self._cancel_stop_orders(symbol)
+
+        # 记录交易历史
+        self.trade_history.append(TradeRecord(
+            coin=coin,
+            side='close_long',
+            quantity=position.quantity,
+            entry_price=position.entry_price,
+            exit_price=current_price,
+            pnl=pnl,
+            pnl_pct=pnl_pct,
+            hold_hours=(cycle_ts - position.entry_time_ns) / 3.6e12,
+            reason=decision.get('justification', ''),
+            timestamp=cycle_ts,
+        ))
+        self._welford_update(pnl_pct)
+
+        # 删除持仓
+        del self.positions[symbol]
+        self._close_failures.pop(symbol, None)
+        self._sync_position_book()
+
+    async def _on_close_failed(self, symbol: str):
+        """
+        平仓失败：指数退避推迟下一次由 tick 触发的平仓，并与交易所持仓对账
+
+        交易所已无该持仓（如已在别处平掉）时移除本地记录，不再反复下单。
+        """
+        failures = self._close_failures.get(symbol, (0, 0.0))[0] + 1
+        delay = min(_CLOSE_RETRY_BASE_SECONDS * 2 ** (failures - 1), _CLOSE_RETRY_MAX_SECONDS)
+        self._close_failures[symbol] = (failures, time.monotonic() + delay)
+
+        try:
+            exchange_positions = await self.exchange.fetch_positions([symbol])
+        except Exception as e:
+            self.logger.warning("%s 持仓对账失败，%ds 后重试平仓: %s", symbol, delay, e)
+            return
+
+        if any(p.get('symbol') == symbol and (p.get('contracts') or 0) > 0 for p in exchange_positions):
+            self.logger.warning("%s 平仓失败，%ds 后重试", symbol, delay)
+            return
+
+        self.logger.warning("%s 交易所已无持仓，移除本地记录", symbol)
+        self.positions.pop(symbol, None)
+        self._close_failures.pop(symbol, None)
+        self._sync_position_book()
+        await self._cancel_stop_orders(symbol)
+    
+    async def _check_existing_position(self, coin: str, decision: Dict, snapshot: MarketSnapshot, cycle_ts: int):
+        """检查现有持仓（行情推送中断时的兜底，正常情况下由 tick 实时触发）"""
+        symbol = self._symbol_by_coin[coin]
+        # 快照价取自本轮开始（AI 请求之前），仅在没有新鲜推送价时使用，避免覆盖更新的 tick 标记价
+        if self._fresh_ticker(symbol, time.time() * 1000) is None:
+            self._mark_price(symbol, snapshot.current_price)
+        await self._check_stop_triggers(cycle_ts)
+
+    async def _check_stop_triggers(self, ts: int):
+        """按标记价一次性检查全部持仓的止损/止盈，触发的持仓合并为一批平仓单"""
+        book = self._position_book
+        if not len(book):
+            return
+        codes = _stop_triggers_nb(book['mark_price'], book['stop_loss'], book['profit_target'])
+
+        intents = []
+        now = time.monotonic()
+        for i in np.flatnonzero(codes):
+            symbol = self._position_symbols[i]
+            if symbol in self._closing:
+                continue
+            # 上次平仓失败，退避期内不重复下单
+            retry = self._close_failures.get(symbol)
+            if retry and now < retry[1]:
+                continue
+            coin = self._coin_by_symbol[symbol]
+            if codes[i] == 1:
+                self.logger.warning("⚠️ %s 触发止损!", coin)
+                reason = '触发止损'
+            else:
+                self.logger.info("🎯 %s 触发止盈!", coin)
+                reason = '触发止盈'
+            intent = self._prepare_sell(coin, {'justification': reason}, float(book['mark_price'][i]), ts)
+            if intent:
+                intents.append(intent)
+
+        if intents:
+            await self._submit_orders(intents, ts)
     
     def _set_stop_orders(self, symbol: str, decision: Dict, quantity: float):
         """OKX 模拟盘：记录止损/止盈，由本地风控处理"""
@@ -888,118 +1437,245 @@ class CryptoAITrader:
         except Exception as e:
             self.logger.warning(f"设置止损止盈失败: {e}")
 
-    def _cancel_stop_orders(self, symbol: str):
-        """取消该合约下所有未成交的条件单（通用）"""
+    async def _cancel_stop_orders(self, symbol: str):
+        """取消该合约下所有未成交的普通委托与条件单（通用）"""
+        await asyncio.gather(
+            self._cancel_open_orders(symbol, {}),
+            self._cancel_open_orders(symbol, {'trigger': True}),
+        )
+
+    async def _cancel_open_orders(self, symbol: str, params: Dict):
+        """撤销一类未成交订单：优先一键全撤，其次按批撤单（每批最多 _ORDER_BATCH_SIZE 笔）"""
         try:
-            open_orders = self.exchange.fetch_open_orders(symbol)
-            for order in open_orders:
-                try:
-                    self.exchange.cancel_order(order['id'], symbol)
-                except Exception:
-                    pass
+            if self.exchange.has.get('cancelAllOrders'):
+                await self.exchange.cancel_all_orders(symbol, params=params)
+                return
+
+            open_orders = await self.exchange.fetch_open_orders(symbol, params=params)
+            ids = [order['id'] for order in open_orders]
+            if not ids:
+                return
+
+            if self.exchange.has.get('cancelOrders'):
+                await asyncio.gather(*(
+                    self.exchange.cancel_orders(ids[i:i + _ORDER_BATCH_SIZE], symbol, params=params)
+                    for i in range(0, len(ids), _ORDER_BATCH_SIZE)
+                ))
+            else:
+                # 单个撤单失败不影响其他订单
+                await asyncio.gather(
+                    *(self.exchange.cancel_order(order_id, symbol, params=params) for order_id in ids),
+                    return_exceptions=True,
+                )
         except Exception as e:
             self.logger.warning(f"取消订单失败: {e}")
     
     # ========== 主循环 ==========
     
-    def run(self, interval_minutes: int = 5, duration_hours: int = 24):
-        """运行交易系统"""
-        self.logger.info("\n" + "="*70)
-        self.logger.info("🚀 加密货币AI交易系统启动")
-        self.logger.info("="*70)
-        self.logger.info(f"AI模型: DeepSeek-V3 (火山引擎 ARK)")
-        self.logger.info(f"交易所: OKX 模拟盘")
-        # 从币种列表提取币种名称（OKX 格式）
-        coin_names = [s.split('/')[0] if '/' in s else s.replace('USDT', '').strip() for s in self.symbols]
-        self.logger.info(f"监控币种: {coin_names}")
-        self.logger.info(f"检查间隔: {interval_minutes} 分钟")
-        self.logger.info(f"运行时长: {duration_hours} 小时")
-        self.logger.info("="*70 + "\n")
-
-        end_time = datetime.now() + timedelta(hours=duration_hours)
-        iteration = 0
+    def _tune_process(self):
+        """
+        降低调度抖动：绑定 CPU 核、提高优先级、尝试实时调度
+
+        均需显式开启（CPU_CORE / REALTIME_SCHED），且为尽力而为：
+        非 Linux、核不存在或缺少 CAP_SYS_NICE 权限时跳过并记录。
+        绑定的核最好通过内核启动参数 isolcpus=<核号> 从通用调度中隔离。
+        """
+        core = self.config.get('CPU_CORE')
+        if core is not None and hasattr(os, 'sched_setaffinity'):
+            try:
+                if core in os.sched_getaffinity(0):
+                    os.sched_setaffinity(0, {core})
+                    self.logger.info(f"📌 事件循环已绑定 CPU {core}")
+                else:
+                    self.logger.warning(f"⚠️ CPU {core} 不可用，跳过绑核")
+            except OSError as e:
+                self.logger.warning(f"⚠️ 绑定 CPU 失败: {e}")
+
+        if not self.config.get('REALTIME_SCHED'):
+            return
 
         try:
-            while datetime.now() < end_time:
-                iteration += 1
-                self.logger.info(f"\n{'='*70}")
-                self.logger.info(f"第 {iteration} 轮 - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-                self.logger.info(f"{'='*70}")
-
-                # 获取市场数据
-                market_data = self.fetch_market_data()
-                if not market_data:
-                    self.logger.warning("数据获取失败，跳过本轮")
-                    time.sleep(60)
-                    continue
+            os.nice(-5)
+        except (AttributeError, OSError) as e:
+            self.logger.warning(f"⚠️ 提高进程优先级失败（需要 CAP_SYS_NICE）: {e}")
 
-                # 获取账户信息
-                account_info = self.get_account_info(market_data)
-
-                # 【关键】月度初始化 - 只在第一次运行时初始化
-                if not self.month_initialized:
-                    is_new_month, msg = self.risk_manager.initialize_month(account_info['account_balance'])
-                    self.logger.info(f"📅 {msg}")
-                    self.month_initialized = True
-
-                # 【关键】检查月度硬止损
-                should_stop, stop_msg = self.risk_manager.check_monthly_stop(account_info['account_balance'])
-                self.logger.info(stop_msg)
-                if should_stop:
-                    self.logger.error("⛔ 触发月度硬止损，系统停止！")
-                    break
-
-                # 打印状态
-                self._print_status(account_info)
-                
-                # AI决策
-                decisions = self.get_ai_decision(market_data, account_info)
-                
-                # 执行交易
-                if decisions:
-                    self.execute_decisions(decisions, market_data, account_info)
-                
-                # 保存检查点
-                if iteration % 12 == 0:
-                    self._save_checkpoint()
-                
-                # 等待
-                self.logger.info(f"\n⏳ 等待 {interval_minutes} 分钟...\n")
-                time.sleep(interval_minutes * 60)
-                
-        except KeyboardInterrupt:
-            self.logger.info("\n⚠️ 用户中断")
-        except Exception as e:
-            self.logger.error(f"系统错误: {e}", exc_info=True)
+        if hasattr(os, 'SCHED_FIFO'):
+            try:
+                os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(10))
+                self.logger.info("⚡ 已启用 SCHED_FIFO 实时调度")
+            except OSError as e:
+                self.logger.warning(f"⚠️ 启用 SCHED_FIFO 失败（需要 CAP_SYS_NICE）: {e}")
+
+    async def run(self, interval_minutes: int = 5, duration_hours: int = 24):
+        """运行交易系统"""
+        # 启动检查也在 try 内：连接失败时同样关闭会话与交易所连接，异常继续上抛给 main
+        try:
+            self._tune_process()
+            # 调试模式下（PYTHONASYNCIODEBUG=1 或 python -X dev）记录阻塞超过 50ms 的回调
+            asyncio.get_running_loop().slow_callback_duration = 0.05
+            await self._check_connection()
+
+            self.logger.info("\n" + "="*70)
+            self.logger.info("🚀 加密货币AI交易系统启动")
+            self.logger.info("="*70)
+            self.logger.info(f"AI模型: DeepSeek-V3 (火山引擎 ARK)")
+            self.logger.info(f"交易所: OKX 模拟盘")
+            self.logger.info(f"监控币种: {self.coin_list}")
+            self.logger.info(f"检查间隔: {interval_minutes} 分钟")
+            self.logger.info(f"运行时长: {duration_hours} 小时")
+            self.logger.info("="*70 + "\n")
+
+            # 运行时长与调度均基于单调时钟，不受系统校时影响
+            deadline = time.monotonic() + duration_hours * 3600
+
+            try:
+                async with asyncio.TaskGroup() as tg:
+                    # 每个合约一个 WebSocket 行情任务，推送经队列汇入中心分发器，逐 tick 检查止损/止盈
+                    tick_queue: asyncio.Queue = asyncio.Queue(maxsize=1000)
+                    stream_tasks = [tg.create_task(self._watch_ticker(symbol, tick_queue)) for symbol in self.symbols]
+                    stream_tasks.append(tg.create_task(self._dispatch_ticks(tick_queue)))
+
+                    await self._decision_loop(interval_minutes * 60, deadline)
+
+                    # 决策循环结束后停止行情任务，TaskGroup 随之退出
+                    for task in stream_tasks:
+                        task.cancel()
+            except (KeyboardInterrupt, asyncio.CancelledError):
+                self.logger.info("\n⚠️ 用户中断")
+            except Exception as e:
+                self.logger.error(f"系统错误: {e}", exc_info=True)
         finally:
             self._generate_report()
+            await self.exchange.close()
+
+    async def _decision_loop(self, interval: float, deadline: float):
+        """
+        定时任务：按固定网格 loop_start + k*interval（单调时钟）拉取行情并走一次 AI 决策
+
+        每轮的处理耗时从等待中扣除，周期不漂移；超时则跳到下一个网格点。
+        """
+        loop_start = time.monotonic()
+        slot = 0
+        iteration = 0
+
+        while time.monotonic() < deadline:
+            # 每轮只取一次系统时间（纳秒时间戳），日志/下单/检查点共用
+            now_ns = time.time_ns()
+            iteration += 1
+            if self.logger.isEnabledFor(logging.INFO):
+                self.logger.info("\n%s\n第 %d 轮 - %s\n%s", '=' * 70, iteration, _fmt_ts(now_ns), '=' * 70)
+
+            # 获取市场数据
+            market_data = await self.fetch_market_data()
+            if not market_data:
+                self.logger.warning("数据获取失败，跳过本轮")
+                # 60 秒后重试，不推进网格
+                await asyncio.sleep(60)
+                continue
+
+            # 获取账户信息
+            account_info = await self.get_account_info(market_data)
+
+            # 【关键】月度初始化 - 只在第一次运行时初始化
+            if not self.month_initialized:
+                is_new_month, msg = self.risk_manager.initialize_month(account_info['account_balance'])
+                self.logger.info("📅 %s", msg)
+                self.month_initialized = True
+
+            # 【关键】检查月度硬止损
+            should_stop, stop_msg = self.risk_manager.check_monthly_stop(account_info['account_balance'])
+            self.logger.info(stop_msg)
+            if should_stop:
+                self.logger.error("⛔ 触发月度硬止损，系统停止！")
+                break
+
+            # 打印状态
+            self._print_status(account_info)
+            
+            # AI决策
+            decisions = await self.get_ai_decision(market_data, account_info)
+            
+            # 执行交易
+            if decisions:
+                await self.execute_decisions(decisions, market_data, account_info, now_ns)
+            
+            # 保存检查点
+            if iteration % 12 == 0:
+                self._save_checkpoint(now_ns)
+            
+            # 等待到下一个网格点
+            slot += 1
+            delay = loop_start + slot * interval - time.monotonic()
+            if delay < 0:
+                missed = math.ceil(-delay / interval)
+                self.logger.warning("⚠️ 本轮耗时超过检查间隔，跳过 %d 个周期", missed)
+                slot += missed
+                delay += missed * interval
+            self.logger.info("\n⏳ 等待 %.1f 分钟...\n", delay / 60)
+            await asyncio.sleep(delay)
+
+    async def _watch_ticker(self, symbol: str, queue: asyncio.Queue):
+        """订阅单个合约的 ticker 推送并放入分发队列，断线后指数退避重连"""
+        backoff = 1
+        while True:
+            try:
+                ticker = await self.exchange.watch_ticker(symbol)
+            except ccxt.NotSupported:
+                self.logger.warning(f"{symbol} 不支持行情推送，止损/止盈仅按决策周期检查")
+                return
+            except Exception as e:
+                self.logger.warning(f"{symbol} 行情推送中断，{backoff}s 后重连: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+                continue
+            backoff = 1
+            await queue.put((symbol, ticker))
+
+    async def _dispatch_ticks(self, queue: asyncio.Queue):
+        """中心分发器：记录最新 ticker 与持仓标记价，并检查止损/止盈"""
+        while True:
+            # 取空队列中积压的推送，合并为一轮检查
+            batch = [await queue.get()]
+            while not queue.empty():
+                batch.append(queue.get_nowait())
+
+            for symbol, ticker in batch:
+                self._latest_tickers[symbol] = ticker
+                price = ticker.get('last')
+                if price:
+                    self._mark_price(symbol, float(price))
+            try:
+                await self._check_stop_triggers(time.time_ns())
+            except Exception as e:
+                self.logger.error("处理行情推送失败: %s", e)
     
     def _print_status(self, account_info: Dict):
         """打印状态"""
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
         self.logger.info("\n📊 账户状态")
         self.logger.info("-" * 60)
-        self.logger.info(f"余额: ${account_info['account_balance']:.2f}")
-        self.logger.info(f"可用: ${account_info['available_cash']:.2f}")
-        self.logger.info(f"回报率: {account_info['total_return_pct']:+.2f}%")
+        self.logger.info("余额: $%.2f", account_info['account_balance'])
+        self.logger.info("可用: $%.2f", account_info['available_cash'])
+        self.logger.info("回报率: %+.2f%%", account_info['total_return_pct'])
         
         if account_info['positions']:
-            self.logger.info(f"\n持仓 ({len(account_info['positions'])} 个):")
+            self.logger.info("\n持仓 (%d 个):", len(account_info['positions']))
             for pos in account_info['positions']:
                 emoji = "🟢" if pos['unrealized_pnl'] > 0 else "🔴"
                 self.logger.info(
-                    f"{emoji} {pos['symbol']}: ${pos['current_price']:.2f} | "
-                    f"盈亏: ${pos['unrealized_pnl']:+.2f} | {pos['leverage']}x"
+                    "%s %s: $%.2f | 盈亏: $%+.2f | %sx",
+                    emoji, pos['symbol'], pos['current_price'], pos['unrealized_pnl'], pos['leverage'],
                 )
     
-    def _save_checkpoint(self):
+    def _save_checkpoint(self, now_ns: int):
         """保存检查点"""
         checkpoint = {
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': now_ns,
             'positions': len(self.positions),
             'trades': len(self.trade_history),
         }
-        with open('outputs/checkpoint.json', 'w', encoding='utf-8') as f:
-            json.dump(checkpoint, f, indent=2, ensure_ascii=False, default=str)
+        Path('outputs/checkpoint.json').write_bytes(_json_dumps(checkpoint, indent=True))
         self.logger.info("💾 检查点已保存")
     
     def _generate_report(self):
@@ -1009,18 +1685,32 @@ class CryptoAITrader:
         self.logger.info("="*70)
         
         if self.trade_history:
-            df = pd.DataFrame(self.trade_history)
-            
-            total_trades = len(df)
-            winning = len(df[df['pnl'] > 0])
+            # 汇总只需计数与求和，直接遍历，fsum 避免累加误差
+            total_trades = len(self.trade_history)
+            winning = sum(1 for t in self.trade_history if t.pnl > 0)
+            total_pnl = math.fsum(t.pnl for t in self.trade_history)
             win_rate = winning / total_trades * 100
-            total_pnl = df['pnl'].sum()
+
+            report_file = 'outputs/trade_history.csv'
+            rows = [asdict(t) for t in self.trade_history]
+            for row in rows:
+                row['timestamp'] = _fmt_ts(row['timestamp'])
+            if pa is not None:
+                # 列式转换，CSV 编码在 Arrow 内核中完成
+                table = pa.Table.from_pylist(rows)
+                with open(report_file, 'wb') as f:
+                    f.write(codecs.BOM_UTF8)  # 与 utf-8-sig 一致，Excel 可直接打开
+                    pacsv.write_csv(table, f)
+            else:
+                with open(report_file, 'w', newline='', encoding='utf-8-sig') as f:
+                    writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+                    writer.writeheader()
+                    writer.writerows(rows)
             
             self.logger.info(f"交易次数: {total_trades}")
             self.logger.info(f"胜率: {win_rate:.1f}% ({winning}胜/{total_trades-winning}负)")
             self.logger.info(f"总盈亏: ${total_pnl:+.2f}")
             
-            df.to_csv('outputs/trade_history.csv', index=False, encoding='utf-8-sig')
             self.logger.info("\n📁 交易历史已保存到 outputs/trade_history.csv")
         else:
             self.logger.info("无交易记录")
@@ -1038,7 +1728,7 @@ def main():
     
     try:
         trader = CryptoAITrader()
-        trader.run(interval_minutes=5, duration_hours=24)
+        asyncio.run(trader.run(interval_minutes=5, duration_hours=24))
     except Exception as e:
         print(f"\n❌ 启动失败: {e}")
         print("\n请检查:")
@@ -0,0 +1,238 @@
+"""
+技术指标计算内核
+- EMA / RSI / MACD / ATR
+- 基于 NumPy 数组的顺序递推，优先使用 AOT 编译模块，其次 numba JIT
+- IndicatorState：按K线增量更新的流式指标状态
+"""
+
+import math
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # numba 为可选依赖，缺失时退化为纯 Python 实现
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda func: func
+
+
+@njit(cache=True)
+def _ema_nb(x, span):
+    """EMA（等价于 pandas ewm(span, adjust=False)）"""
+    n = x.shape[0]
+    out = np.empty(n)
+    if n == 0:
+        return out
+    alpha = 2.0 / (span + 1.0)
+    prev = x[0]
+    out[0] = prev
+    for i in range(1, n):
+        prev = alpha * x[i] + (1.0 - alpha) * prev
+        out[i] = prev
+    return out
+
+
+@njit(cache=True)
+def _rsi_nb(close, window):
+    """RSI（涨跌幅简单移动平均版本，与 rolling(window).mean() 一致）"""
+    n = close.shape[0]
+    out = np.full(n, np.nan)
+    gain_sum = 0.0
+    loss_sum = 0.0
+    for i in range(n):
+        delta = close[i] - close[i - 1] if i > 0 else 0.0
+        gain_sum += delta if delta > 0 else 0.0
+        loss_sum += -delta if delta < 0 else 0.0
+        if i >= window:
+            old = close[i - window] - close[i - window - 1] if i > window else 0.0
+            gain_sum -= old if old > 0 else 0.0
+            loss_sum -= -old if old < 0 else 0.0
+        if i >= window - 1:
+            if loss_sum > 0:
+                out[i] = 100.0 - 100.0 / (1.0 + gain_sum / loss_sum)
+            elif gain_sum > 0:
+                out[i] = 100.0
+    return out
+
+
+@njit(cache=True)
+def _rolling_mean_nb(x, window):
+    """简单移动平均（累加和差分，整段向量化），前 window-1 个值为 NaN"""
+    n = x.shape[0]
+    out = np.full(n, np.nan)
+    if n < window:
+        return out
+    csum = np.cumsum(x)
+    out[window - 1] = csum[window - 1] / window
+    out[window:] = (csum[window:] - csum[:-window]) / window
+    return out
+
+
+@njit(cache=True)
+def _compute_indicators_jit(close, high, low):
+    """
+    一次性计算全部指标
+
+    Returns:
+        形状 (7, n) 的数组，行顺序同 INDICATOR_COLUMNS：
+        ema20, ema50, rsi7, rsi14, macd_hist, atr3, atr14
+    """
+    n = close.shape[0]
+    out = np.empty((7, n))
+
+    out[0] = _ema_nb(close, 20)
+    out[1] = _ema_nb(close, 50)
+    out[2] = _rsi_nb(close, 7)
+    out[3] = _rsi_nb(close, 14)
+
+    # MACD 柱 = (EMA12 - EMA26) - signal(9)
+    macd_line = _ema_nb(close, 12) - _ema_nb(close, 26)
+    out[4] = macd_line - _ema_nb(macd_line, 9)
+
+    # 真实波幅：max(H-L, |H-前收|, |L-前收|)，首根仅 H-L；三列逐元素取最大，不构造二维缓冲
+    tr = high - low
+    if n > 1:
+        prev_close = close[:-1]
+        hc = np.abs(high[1:] - prev_close)
+        lc = np.abs(low[1:] - prev_close)
+        tr[1:] = np.maximum(tr[1:], np.maximum(hc, lc))
+    out[5] = _rolling_mean_nb(tr, 3)
+    out[6] = _rolling_mean_nb(tr, 14)
+
+    return out
+
+
+try:
+    # AOT 编译产物（python build_indicators.py 生成），导入即用，无 JIT 预热
+    from indicators_aot import _compute_indicators_nb
+except ImportError:
+    _compute_indicators_nb = _compute_indicators_jit
+
+
+# 下游读取的指标列
+INDICATOR_COLUMNS = ('ema_20', 'ema_50', 'rsi_7', 'rsi_14', 'macd_histogram', 'atr_3', 'atr_14')
+# 每列保留的最近序列长度（提示词使用最近10根）
+SERIES_LENGTH = 10
+
+
+def _alpha(span: int) -> float:
+    return 2.0 / (span + 1.0)
+
+
+def _rsi(gains: List[float], losses: List[float]) -> float:
+    gain_sum = sum(gains)
+    loss_sum = sum(losses)
+    if loss_sum > 0:
+        return 100.0 - 100.0 / (1.0 + gain_sum / loss_sum)
+    return 100.0 if gain_sum > 0 else math.nan
+
+
+@dataclass
+class IndicatorState:
+    """
+    单一周期的增量指标状态
+
+    只累积已收盘K线：EMA 保存上一值，RSI/ATR 保存定长窗口，
+    每根新K线 O(1) 更新；未收盘K线通过 peek 计算而不写入状态。
+    """
+
+    last_ts: Optional[int] = None
+    prev_close: Optional[float] = None
+    ema_12: float = 0.0
+    ema_20: float = 0.0
+    ema_26: float = 0.0
+    ema_50: float = 0.0
+    macd_signal: float = 0.0
+    gains: Deque[float] = field(default_factory=lambda: deque(maxlen=14))
+    losses: Deque[float] = field(default_factory=lambda: deque(maxlen=14))
+    trs: Deque[float] = field(default_factory=lambda: deque(maxlen=14))
+    history: Dict[str, Deque[float]] = field(
+        default_factory=lambda: {col: deque(maxlen=SERIES_LENGTH) for col in INDICATOR_COLUMNS}
+    )
+
+    def _step(self, bar: List[float]):
+        """计算一根K线后的指标值与新状态（不修改自身）"""
+        high, low, close = float(bar[2]), float(bar[3]), float(bar[4])
+
+        if self.prev_close is None:
+            ema_12 = ema_20 = ema_26 = ema_50 = close
+            gain = loss = 0.0
+            tr = high - low
+            macd_line = 0.0
+            macd_signal = 0.0
+        else:
+            ema_12 = _alpha(12) * close + (1 - _alpha(12)) * self.ema_12
+            ema_20 = _alpha(20) * close + (1 - _alpha(20)) * self.ema_20
+            ema_26 = _alpha(26) * close + (1 - _alpha(26)) * self.ema_26
+            ema_50 = _alpha(50) * close + (1 - _alpha(50)) * self.ema_50
+            delta = close - self.prev_close
+            gain = max(delta, 0.0)
+            loss = max(-delta, 0.0)
+            tr = max(high - low, abs(high - self.prev_close), abs(low - self.prev_close))
+            macd_line = ema_12 - ema_26
+            macd_signal = _alpha(9) * macd_line + (1 - _alpha(9)) * self.macd_signal
+
+        gains = list(self.gains)[-13:] + [gain]
+        losses = list(self.losses)[-13:] + [loss]
+        trs = list(self.trs)[-13:] + [tr]
+
+        row = {
+            'ema_20': ema_20,
+            'ema_50': ema_50,
+            'rsi_7': _rsi(gains[-7:], losses[-7:]) if len(gains) >= 7 else math.nan,
+            'rsi_14': _rsi(gains, losses) if len(gains) >= 14 else math.nan,
+            'macd_histogram': macd_line - macd_signal,
+            'atr_3': sum(trs[-3:]) / 3 if len(trs) >= 3 else math.nan,
+            'atr_14': sum(trs) / 14 if len(trs) >= 14 else math.nan,
+        }
+        new_state = {
+            'last_ts': int(bar[0]),
+            'prev_close': close,
+            'ema_12': ema_12,
+            'ema_20': ema_20,
+            'ema_26': ema_26,
+            'ema_50': ema_50,
+            'macd_signal': macd_signal,
+        }
+        return row, new_state, gain, loss, tr
+
+    def update(self, bar: List[float]) -> Dict[str, float]:
+        """写入一根已收盘K线，返回该K线的指标值"""
+        row, new_state, gain, loss, tr = self._step(bar)
+        for name, value in new_state.items():
+            setattr(self, name, value)
+        self.gains.append(gain)
+        self.losses.append(loss)
+        self.trs.append(tr)
+        for col in INDICATOR_COLUMNS:
+            self.history[col].append(row[col])
+        return row
+
+    def peek(self, bar: List[float]) -> Dict[str, float]:
+        """计算未收盘K线的指标值，不写入状态"""
+        return self._step(bar)[0]
+
+    def advance(self, klines: List[List[float]]) -> Dict[str, np.ndarray]:
+        """
+        用连续K线窗口推进状态
+
+        最后一根视为未收盘：之前尚未写入的K线逐根 update，最后一根 peek。
+        要求 klines 与已写入的K线连续（调用方负责缺口检测）。
+
+        Returns:
+            各指标最近 SERIES_LENGTH 个值（最后一个对应最新K线）
+        """
+        for bar in klines[:-1]:
+            if self.last_ts is None or int(bar[0]) > self.last_ts:
+                self.update(bar)
+
+        latest = self.peek(klines[-1])
+        return {
+            col: np.array(list(self.history[col])[1 - SERIES_LENGTH:] + [latest[col]], dtype=np.float64)
+            for col in INDICATOR_COLUMNS
+        }
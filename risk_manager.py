@@ -2,13 +2,82 @@
 月度风险管理系统
 - 初始资金记录
 - 月度回撤底线（-6%）
-- 交易历史记录
+- 交易历史记录（SQLite，WAL 模式；开仓一条 INSERT，平仓一条 UPDATE）
 """
 
+import atexit
 import json
+import sqlite3
+import time
+from contextlib import contextmanager
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, List, Optional
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖，缺失时使用标准库 json
+    orjson = None
+
+
+def _json_loads(data):
+    """解析 JSON：优先 orjson，缺失或遇到非标准 JSON（如 NaN）时回退标准库"""
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(data)
+
+
+def _json_dumps(obj, indent: bool = False) -> bytes:
+    """序列化为 UTF-8 JSON：优先 orjson（原生支持 datetime/numpy），缺失时回退标准库"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, option=option, default=str)
+    return json.dumps(obj, indent=2 if indent else None, ensure_ascii=False, default=str).encode('utf-8')
+
+
+# 交易表的列；平仓列仅在 status='closed' 时出现在交易记录中
+_TRADE_COLUMNS = (
+    'id', 'timestamp', 'coin', 'signal', 'entry_price', 'quantity', 'leverage', 'stop_loss',
+    'profit_target', 'entry_logic', 'structure', 'confidence', 'status',
+    'exit_price', 'exit_logic', 'pnl', 'pnl_pct',
+)
+_CLOSE_COLUMNS = ('exit_price', 'exit_logic', 'pnl', 'pnl_pct')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    month_start_date TEXT,
+    month_initial_balance REAL,
+    month_drawdown_limit REAL,
+    last_trade_logic TEXT
+);
+CREATE TABLE IF NOT EXISTS trades (
+    id INTEGER PRIMARY KEY,
+    timestamp INTEGER,
+    coin TEXT,
+    signal TEXT,
+    entry_price REAL,
+    quantity REAL,
+    leverage INTEGER,
+    stop_loss REAL,
+    profit_target REAL,
+    entry_logic TEXT,
+    structure TEXT,
+    confidence REAL,
+    status TEXT NOT NULL,
+    exit_price REAL,
+    exit_logic TEXT,
+    pnl REAL,
+    pnl_pct REAL
+);
+CREATE INDEX IF NOT EXISTS idx_trades_open ON trades(status) WHERE status = 'open';
+DROP INDEX IF EXISTS idx_trades_coin;
+"""
 
 
 class MonthlyRiskManager:
@@ -16,27 +85,133 @@ class MonthlyRiskManager:
 
     def __init__(self, data_file: str = 'trading_memory.json'):
         self.data_file = Path(data_file)
+        # 数据存于同名 .db；旧版 JSON 文件首次启动时迁移，原文件保留不动
+        self.db_file = self.data_file.with_suffix('.db')
+
+        # 交易表以数据库为准，内存只保留月度状态与运行统计量；每次修改即写库（WAL + synchronous=NORMAL，提交不等待 fsync）
+        self.db = sqlite3.connect(self.db_file, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(_SCHEMA)
+
+        # 以库内状态判断是否需要迁移：迁移在单个事务内完成，中途失败时 meta 仍为空，下次启动会重试
+        if self.db.execute('SELECT 1 FROM meta').fetchone() is None:
+            self._migrate_legacy_files()
         self.data = self._load_data()
 
-    def _load_data(self) -> Dict:
-        """加载交易数据"""
-        if self.data_file.exists():
-            with open(self.data_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+        # 运行统计量：启动时聚合一次，之后增删改 O(1) 维护
+        self._load_stats()
 
-        return {
+        atexit.register(self.close)
+
+    @contextmanager
+    def _transaction(self):
+        """显式事务（连接为自动提交模式）"""
+        self.db.execute('BEGIN')
+        try:
+            yield self.db
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            raise
+        self.db.execute('COMMIT')
+
+    def _load_data(self) -> Dict:
+        """加载月度状态（交易记录按需从数据库查询）"""
+        data = {
             'month_start_date': None,
             'month_initial_balance': None,
             'month_drawdown_limit': None,
-            'all_trades': [],
             'current_positions': {},
             'last_trade_logic': None
         }
 
-    def _save_data(self):
-        """保存数据"""
-        with open(self.data_file, 'w', encoding='utf-8') as f:
-            json.dump(self.data, f, indent=2, ensure_ascii=False)
+        meta = self.db.execute(
+            'SELECT month_start_date, month_initial_balance, month_drawdown_limit, last_trade_logic FROM meta'
+        ).fetchone()
+        if meta:
+            data['month_start_date'], data['month_initial_balance'], data['month_drawdown_limit'] = meta[:3]
+            last = _json_loads(meta[3]) if meta[3] else None
+            # 上一笔交易逻辑以交易表中的记录为准，带上之后的平仓字段
+            data['last_trade_logic'] = (last and self._fetch_trade(last.get('id'))) or last
+        return data
+
+    @staticmethod
+    def _row_to_trade(row) -> Dict:
+        trade = dict(zip(_TRADE_COLUMNS, row))
+        if trade['status'] != 'closed':
+            for column in _CLOSE_COLUMNS:
+                del trade[column]
+        return trade
+
+    def _fetch_trade(self, trade_id: Optional[int]) -> Optional[Dict]:
+        """按 id 读取单笔交易（主键查询）"""
+        row = self.db.execute(
+            f"SELECT {', '.join(_TRADE_COLUMNS)} FROM trades WHERE id = ?", (trade_id,)
+        ).fetchone()
+        return self._row_to_trade(row) if row else None
+
+    def _query_trades(self, where: str = '') -> List[Dict]:
+        rows = self.db.execute(f"SELECT {', '.join(_TRADE_COLUMNS)} FROM trades {where} ORDER BY id")
+        return [self._row_to_trade(row) for row in rows]
+
+    def _migrate_legacy_files(self):
+        """从旧版单个 JSON 文件导入"""
+        if not self.data_file.exists():
+            return
+        legacy = _json_loads(self.data_file.read_bytes())
+
+        with self._transaction() as db:
+            self._write_meta(db, legacy)
+            db.executemany(
+                f"INSERT OR REPLACE INTO trades ({', '.join(_TRADE_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(_TRADE_COLUMNS))})",
+                ([trade.get(column) for column in _TRADE_COLUMNS] for trade in legacy.get('all_trades', [])),
+            )
+
+    @staticmethod
+    def _write_meta(db: sqlite3.Connection, data: Dict):
+        """写入月度状态（单行表）"""
+        last = data.get('last_trade_logic')
+        db.execute(
+            'INSERT OR REPLACE INTO meta '
+            '(id, month_start_date, month_initial_balance, month_drawdown_limit, last_trade_logic) '
+            'VALUES (1, ?, ?, ?, ?)',
+            (
+                data.get('month_start_date'),
+                data.get('month_initial_balance'),
+                data.get('month_drawdown_limit'),
+                _json_dumps(last).decode('utf-8') if last else None,
+            ),
+        )
+
+    def _load_stats(self):
+        """由数据库聚合出运行统计量（加载/换月时调用）"""
+        (self._max_id, self._trade_count, self._open_count,
+         self._closed_count, self._win_count, self._lose_count, self._total_pnl) = self.db.execute(
+            "SELECT COALESCE(MAX(id), 0), COUNT(*), "
+            "COALESCE(SUM(status = 'open'), 0), "
+            "COALESCE(SUM(status = 'closed' AND pnl IS NOT NULL), 0), "
+            "COALESCE(SUM(status = 'closed' AND pnl > 0), 0), "
+            "COALESCE(SUM(status = 'closed' AND pnl < 0), 0), "
+            "TOTAL(CASE WHEN status = 'closed' THEN pnl END) "
+            "FROM trades"
+        ).fetchone()
+
+    def _count_closed(self, trade: Dict, sign: int):
+        """将一笔已平仓交易计入（sign=1）或移出（sign=-1）统计量"""
+        if trade['status'] != 'closed' or trade.get('pnl') is None:
+            return
+        pnl = trade['pnl']
+        self._closed_count += sign
+        self._total_pnl += sign * pnl
+        if pnl > 0:
+            self._win_count += sign
+        elif pnl < 0:
+            self._lose_count += sign
+
+    def close(self):
+        """关闭数据库（进程退出时自动调用），WAL 内容合并回主库"""
+        self.db.close()
 
     def initialize_month(self, current_balance: float):
         """
@@ -54,8 +229,10 @@ class MonthlyRiskManager:
             self.data['month_initial_balance'] = current_balance
             # 固定月度回撤底线为 6%
             self.data['month_drawdown_limit'] = current_balance * 0.94
-            self.data['all_trades'] = []
-            self._save_data()
+            with self._transaction() as db:
+                db.execute('DELETE FROM trades')
+                self._write_meta(db, self.data)
+            self._load_stats()
 
             return True, f"新月度初始化: {month_start}, 初始资金: ${current_balance:.2f}, 回撤底线: ${self.data['month_drawdown_limit']:.2f}"
 
@@ -88,7 +265,7 @@ class MonthlyRiskManager:
 
         Args:
             trade_info: {
-                'timestamp': '2025-10-30 01:05:00',
+                'timestamp': 1761757500000000000,  # 纳秒时间戳
                 'coin': 'BTC',
                 'signal': 'buy/sell/hold',
                 'entry_price': 95000,
@@ -103,8 +280,8 @@ class MonthlyRiskManager:
             }
         """
         trade_record = {
-            'id': len(self.data['all_trades']) + 1,
-            'timestamp': trade_info.get('timestamp', datetime.now().isoformat()),
+            'id': self._max_id + 1,
+            'timestamp': trade_info.get('timestamp') or time.time_ns(),
             'coin': trade_info.get('coin'),
             'signal': trade_info.get('signal'),
             'entry_price': trade_info.get('entry_price'),
@@ -118,9 +295,17 @@ class MonthlyRiskManager:
             'status': 'open'  # open/closed
         }
 
-        self.data['all_trades'].append(trade_record)
+        with self._transaction() as db:
+            db.execute(
+                f"INSERT INTO trades ({', '.join(trade_record)}) VALUES ({', '.join('?' * len(trade_record))})",
+                tuple(trade_record.values()),
+            )
+            self._write_meta(db, {**self.data, 'last_trade_logic': trade_record})
+
+        self._max_id = trade_record['id']
+        self._trade_count += 1
+        self._open_count += 1
         self.data['last_trade_logic'] = trade_record
-        self._save_data()
 
         return trade_record
 
@@ -133,56 +318,64 @@ class MonthlyRiskManager:
             exit_price: 平仓价格
             exit_logic: 平仓理由
         """
-        for trade in self.data['all_trades']:
-            if trade['id'] == trade_id:
-                trade['status'] = 'closed'
-                trade['exit_price'] = exit_price
-                trade['exit_logic'] = exit_logic
-
-                # 计算盈亏
-                if trade['signal'] == 'buy':
-                    pnl = (exit_price - trade['entry_price']) * trade['quantity'] * trade['leverage']
-                else:
-                    pnl = (trade['entry_price'] - exit_price) * trade['quantity'] * trade['leverage']
+        trade = self._fetch_trade(trade_id)
+        if trade is None:
+            return None
+
+        # 计算盈亏
+        if trade['signal'] == 'buy':
+            pnl = (exit_price - trade['entry_price']) * trade['quantity'] * trade['leverage']
+        else:
+            pnl = (trade['entry_price'] - exit_price) * trade['quantity'] * trade['leverage']
+
+        patch = {
+            'status': 'closed',
+            'exit_price': exit_price,
+            'exit_logic': exit_logic,
+            'pnl': pnl,
+            'pnl_pct': (pnl / (trade['entry_price'] * trade['quantity'])) * 100 if trade['quantity'] > 0 else 0,
+        }
+        self.db.execute(
+            f"UPDATE trades SET {', '.join(f'{k} = ?' for k in patch)} WHERE id = ?",
+            (*patch.values(), trade_id),
+        )
 
-                trade['pnl'] = pnl
-                trade['pnl_pct'] = (pnl / (trade['entry_price'] * trade['quantity'])) * 100 if trade['quantity'] > 0 else 0
+        # 重复平仓时先移出旧盈亏，再计入新值
+        if trade['status'] == 'open':
+            self._open_count -= 1
+        self._count_closed(trade, -1)
+        trade.update(patch)
+        self._count_closed(trade, 1)
 
-                self._save_data()
-                return trade
+        last = self.data['last_trade_logic']
+        if last and last.get('id') == trade_id:
+            last.update(patch)
 
-        return None
+        return trade
 
     def get_all_trades(self) -> List[Dict]:
         """获取所有交易"""
-        return self.data['all_trades']
+        return self._query_trades()
 
     def get_last_trade_logic(self) -> Dict:
         """获取上一笔交易的逻辑"""
         return self.data.get('last_trade_logic', {})
 
     def get_open_trades(self) -> List[Dict]:
-        """获取开仓中的交易"""
-        return [t for t in self.data['all_trades'] if t['status'] == 'open']
+        """获取开仓中的交易（走 status='open' 部分索引）"""
+        return self._query_trades("WHERE status = 'open'")
 
     def get_month_stats(self) -> Dict:
-        """获取月度统计"""
-        trades = self.data['all_trades']
-        closed_trades = [t for t in trades if t['status'] == 'closed' and 'pnl' in t]
-
-        total_pnl = sum(t.get('pnl', 0) for t in closed_trades)
-        win_trades = [t for t in closed_trades if t.get('pnl', 0) > 0]
-        lose_trades = [t for t in closed_trades if t.get('pnl', 0) < 0]
-
+        """获取月度统计（O(1)，基于运行统计量）"""
         return {
             'month': self.data['month_start_date'],
             'initial_balance': self.data['month_initial_balance'],
             'drawdown_limit': self.data['month_drawdown_limit'],
-            'total_trades': len(trades),
-            'closed_trades': len(closed_trades),
-            'open_trades': len([t for t in trades if t['status'] == 'open']),
-            'total_pnl': total_pnl,
-            'win_rate': len(win_trades) / len(closed_trades) * 100 if closed_trades else 0,
-            'win_count': len(win_trades),
-            'lose_count': len(lose_trades)
+            'total_trades': self._trade_count,
+            'closed_trades': self._closed_count,
+            'open_trades': self._open_count,
+            'total_pnl': self._total_pnl,
+            'win_rate': self._win_count / self._closed_count * 100 if self._closed_count else 0,
+            'win_count': self._win_count,
+            'lose_count': self._lose_count
         }